@@ -2,15 +2,23 @@
 DataAnalysisAgent – ReAct-style orchestrator inspired by Microsoft AutoGen.
 
 The agent receives a user query, plans which tools to call, executes them
-sequentially (passing intermediate results to subsequent steps when needed),
-and finally synthesises a natural-language report.
+(independent steps concurrently, passing intermediate results to subsequent
+steps when needed), and finally synthesises a natural-language report.
 """
 
-from typing import Any, Dict, List, Optional, Tuple
+import copy
+import functools
+import hashlib
+import json
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from agent.tool_registry import ToolRegistry
 from core.database import DatabaseManager
 from core.dialogue_context import DialogueContext
+from core.embeddings import EmbeddingIndex, embed, literal_signature
+from core.embeddings import warm_up as warm_up_encoder
 from core.llm_client import LLMClient
 from tools.data_inspector import DataInspectorTool
 from tools.data_profiling import DataProfilingTool
@@ -23,6 +31,86 @@ from utils.logger import get_logger
 logger = get_logger(__name__)
 
 MAX_STEPS = 8
+MAX_PARALLEL_STEPS = 4
+
+PLAN_CACHE_SIZE = 256
+PLAN_CACHE_THRESHOLD = 0.92
+EMBEDDING_CACHE_SIZE = 1024
+_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+class PlanCache:
+    """LRU cache of tool plans, matched on query embeddings.
+
+    Semantically equivalent questions against the same schema reuse an
+    earlier plan instead of paying for another ``plan_tools`` round-trip.
+    Plan arguments carry the query's literals, so a match also needs the
+    same numbers and quoted strings ("2023年" and "2024年" embed alike).
+    Embeddings come from a local sentence-transformers model; if it is not
+    installed the cache degrades to exact matching on the normalised query.
+    """
+
+    def __init__(self, max_size: int = PLAN_CACHE_SIZE, threshold: float = PLAN_CACHE_THRESHOLD):
+        self.max_size = max_size
+        self.threshold = threshold
+        # normalised query -> (schema hash, literal signature, plan)
+        self._entries: "OrderedDict[str, Tuple[str, Tuple[str, ...], List[Dict[str, Any]]]]" = OrderedDict()
+        self._index = EmbeddingIndex(max_size)
+        self._embed = functools.lru_cache(maxsize=EMBEDDING_CACHE_SIZE)(
+            functools.partial(embed, _EMBEDDING_MODEL)
+        )
+
+    def warm_up(self):
+        """Load the embedding model on a background thread."""
+        warm_up_encoder(_EMBEDDING_MODEL)
+
+    @staticmethod
+    def _normalise(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    @staticmethod
+    def _schema_hash(data_schema: str) -> str:
+        return hashlib.sha1(data_schema.encode("utf-8")).hexdigest()
+
+    def get(self, query: str, data_schema: str) -> Optional[List[Dict[str, Any]]]:
+        key = self._normalise(query)
+        schema_hash = self._schema_hash(data_schema)
+
+        entry = self._entries.get(key)
+        if entry is None:
+            if not len(self._index):
+                return None
+            q = self._embed(key)
+            if q is None:
+                return None
+            match = self._index.search(q)
+            if match is None or match[1] <= self.threshold:
+                return None
+            key = match[0]
+            entry = self._entries[key]
+
+        if entry[0] != schema_hash or entry[1] != literal_signature(query):
+            return None
+        self._entries.move_to_end(key)
+        logger.info("Plan cache hit: %s", key)
+        return copy.deepcopy(entry[2])
+
+    def put(self, query: str, data_schema: str, plan: List[Dict[str, Any]]):
+        key = self._normalise(query)
+        if self._entries.pop(key, None) is not None:
+            self._index.remove(key)
+        while len(self._entries) >= self.max_size:
+            old_key, _ = self._entries.popitem(last=False)
+            self._index.remove(old_key)
+
+        vec = self._embed(key)
+        if vec is not None:
+            self._index.add(key, vec)
+        self._entries[key] = (self._schema_hash(data_schema), literal_signature(query), copy.deepcopy(plan))
+
+    def clear(self):
+        self._entries.clear()
+        self._index.clear()
 
 
 class DataAnalysisAgent:
@@ -33,10 +121,29 @@ class DataAnalysisAgent:
         self.llm = LLMClient()
         self.context = DialogueContext()
         self.registry = ToolRegistry()
+        self.plan_cache = PlanCache()
+        self.plan_cache.warm_up()
+        self._executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_STEPS, thread_name_prefix="tool")
         self._register_tools()
-        self._data_schema = self.db.get_table_info()
+        self._warm_caches()
         logger.info("DataAnalysisAgent initialised with %d tools", len(self.registry.list_tools()))
 
+    def _warm_caches(self):
+        """Load schema and tool metadata up front so the first query does not pay for it."""
+        self._data_schema = self.db.get_table_info()
+        self._all_columns = self.db.get_all_columns()
+        self._descriptions_text = self.registry.descriptions_text
+
+    def refresh_schema(self):
+        """Reload cached schema state; call after DDL changes to the database."""
+        self.db.invalidate_schema_cache()
+        self.plan_cache.clear()
+        for tool in self.registry.list_tools():
+            hook = getattr(tool, "invalidate_schema", None) or getattr(tool, "invalidate", None)
+            if hook is not None:
+                hook()
+        self._warm_caches()
+
     # ------------------------------------------------------------------
     # Tool registration
     # ------------------------------------------------------------------
@@ -61,66 +168,60 @@ class DataAnalysisAgent:
                 "images": [str, ...],  # paths to generated charts
             }
         """
+        result: Dict[str, Any] = {}
+        for result in self.process_query_stream(user_query):
+            pass
+        return result
+
+    def process_query_stream(self, user_query: str) -> Iterator[Dict[str, Any]]:
+        """Like ``process_query`` but streams the final answer.
+
+        Yields dicts of the same shape as ``process_query`` whose ``response``
+        grows as the LLM produces tokens; the last one is the complete result.
+        """
         logger.info(">>> New query: %s", user_query)
 
+        # Follow-ups depend on earlier turns, so only opening questions use the plan cache.
+        cacheable = not self.context.get_all_messages()
         self.context.add_message("user", user_query)
         history = self.context.get_formatted_history()
 
         # --- Step 1: Plan ---
-        plan = self.llm.plan_tools(
-            user_query,
-            self.registry.get_descriptions(),
-            conversation_history=history,
-            data_schema=self._data_schema,
-        )
+        plan = self.plan_cache.get(user_query, self._data_schema) if cacheable else None
+        if plan is None:
+            plan = self.llm.plan_tools(
+                user_query,
+                self._descriptions_text,
+                conversation_history=history,
+                data_schema=self._data_schema,
+            )
+            if cacheable and any(step.get("tool") != "general_chat" for step in plan):
+                self.plan_cache.put(user_query, self._data_schema, plan)
         logger.info("Plan: %s", plan)
 
         # --- Handle general chat ---
         if len(plan) == 1 and plan[0].get("tool") == "general_chat":
-            answer = self.llm.general_chat(user_query)
+            answer = ""
+            for delta in self.llm.general_chat_stream(user_query):
+                answer += delta
+                yield {"response": answer, "tool_results": [], "images": []}
             self.context.add_message("assistant", answer, {"type": "general"})
-            return {"response": answer, "tool_results": [], "images": []}
+            yield {"response": answer, "tool_results": [], "images": []}
+            return
 
         # --- Step 2: Execute tools ---
-        tool_results: List[Dict[str, Any]] = []
-        images: List[str] = []
-        accumulated_context = ""
-
-        for i, step in enumerate(plan[:MAX_STEPS]):
-            tool_name = step.get("tool", "")
-            args = step.get("args", {})
-            reason = step.get("reason", "")
-
-            if tool_name == "general_chat":
-                continue
-
-            if tool_name == "report_generator" and accumulated_context:
-                args.setdefault("analysis_results", accumulated_context)
-                args.setdefault("question", user_query)
-
-            if "context" not in args:
-                args["context"] = history
-
-            logger.info("Step %d: %s – %s", i + 1, tool_name, reason)
-            result = self.registry.execute(tool_name, **args)
-
-            result["tool"] = tool_name
-            result["reason"] = reason
-            tool_results.append(result)
-
-            if result.get("image_path"):
-                images.append(result["image_path"])
-
-            result_text = result.get("result", "")
-            accumulated_context += f"\n\n### {tool_name} ({reason})\n{result_text}"
+        tool_results, images = self._execute_plan(plan, user_query, history)
 
         # --- Step 3: Synthesise ---
         if tool_results:
-            final_response = self.llm.summarise_results(
-                user_query, tool_results, history
-            )
+            deltas = self.llm.summarise_results_stream(user_query, tool_results, history)
         else:
-            final_response = self.llm.general_chat(user_query)
+            deltas = self.llm.general_chat_stream(user_query)
+
+        final_response = ""
+        for delta in deltas:
+            final_response += delta
+            yield {"response": final_response, "tool_results": tool_results, "images": images}
 
         self.context.add_message(
             "assistant",
@@ -132,16 +233,98 @@ class DataAnalysisAgent:
             },
         )
 
-        return {
+        yield {
             "response": final_response,
             "tool_results": tool_results,
             "images": images,
         }
 
+    def _execute_plan(
+        self,
+        plan: List[Dict[str, Any]],
+        user_query: str,
+        history: str,
+    ) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Run the planned tool calls and collect their results in plan order.
+
+        Consecutive steps that do not consume earlier results run concurrently
+        on the agent's thread pool. ``report_generator`` needs the accumulated
+        output of everything before it, so it acts as a barrier. Tools that are
+        not thread-safe run on the calling thread.
+        """
+        tool_results: List[Dict[str, Any]] = []
+        images: List[str] = []
+        accumulated_parts: List[str] = []
+        step_cache: Dict[str, Future] = {}
+        pending: List[Tuple[str, str, Future, bool]] = []
+
+        def collect():
+            for tool_name, reason, future, duplicate in pending:
+                result = future.result()
+                if duplicate:
+                    result = dict(result)
+                result["tool"] = tool_name
+                result["reason"] = reason
+                tool_results.append(result)
+
+                if result.get("image_path") and not duplicate:
+                    images.append(result["image_path"])
+
+                result_text = result.get("result", "")
+                accumulated_parts.append(f"\n\n### {tool_name} ({reason})\n{result_text}")
+            pending.clear()
+
+        for i, step in enumerate(plan[:MAX_STEPS]):
+            tool_name = step.get("tool", "")
+            args = step.get("args", {})
+            reason = step.get("reason", "")
+
+            if tool_name == "general_chat":
+                continue
+
+            depends_on_previous = tool_name == "report_generator"
+            if depends_on_previous:
+                collect()
+                if accumulated_parts:
+                    args.setdefault("analysis_results", "".join(accumulated_parts))
+                    args.setdefault("question", user_query)
+
+            if "context" not in args:
+                args["context"] = history
+
+            tool = self.registry.get(tool_name)
+            key = None
+            if tool is not None and tool.idempotent:
+                key = hashlib.sha1(
+                    json.dumps({"t": tool_name, "a": args}, sort_keys=True, default=str).encode("utf-8")
+                ).hexdigest()
+
+            if key is not None and key in step_cache:
+                logger.info("Step %d: %s – reusing identical earlier call", i + 1, tool_name)
+                pending.append((tool_name, reason, step_cache[key], True))
+            else:
+                logger.info("Step %d: %s – %s", i + 1, tool_name, reason)
+                if tool is not None and not tool.thread_safe:
+                    future = Future()
+                    future.set_result(self.registry.execute(tool_name, **args))
+                else:
+                    future = self._executor.submit(self.registry.execute, tool_name, **args)
+                if key is not None:
+                    step_cache[key] = future
+                pending.append((tool_name, reason, future, False))
+
+            if depends_on_previous:
+                collect()
+
+        collect()
+        return tool_results, images
+
     # ------------------------------------------------------------------
     # Convenience helpers
     # ------------------------------------------------------------------
     def clear_context(self):
+        # Plans are keyed on schema and query literals, not on the conversation,
+        # so they stay valid for the next one; refresh_schema() clears them.
         self.context.clear_context()
 
     def get_session_info(self) -> Dict[str, Any]:
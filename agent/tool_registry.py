@@ -1,5 +1,6 @@
 from typing import Dict, List, Optional
 
+from core.llm_client import format_tool_descriptions
 from tools.base_tool import BaseTool
 from utils.logger import get_logger
 
@@ -11,9 +12,11 @@ class ToolRegistry:
 
     def __init__(self):
         self._tools: Dict[str, BaseTool] = {}
+        self._descriptions_cache: Optional[str] = None
 
     def register(self, tool: BaseTool):
         self._tools[tool.name] = tool
+        self._descriptions_cache = None
         logger.info("Registered tool: %s", tool.name)
 
     def get(self, name: str) -> Optional[BaseTool]:
@@ -25,6 +28,13 @@ class ToolRegistry:
     def get_descriptions(self) -> List[Dict[str, str]]:
         return [t.get_description() for t in self._tools.values()]
 
+    @property
+    def descriptions_text(self) -> str:
+        """Tool list pre-rendered for the planning prompt."""
+        if self._descriptions_cache is None:
+            self._descriptions_cache = format_tool_descriptions(self.get_descriptions())
+        return self._descriptions_cache
+
     def execute(self, name: str, **kwargs) -> dict:
         tool = self.get(name)
         if tool is None:
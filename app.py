@@ -16,6 +16,9 @@ from utils.logger import setup_logging
 # Initialise agent
 agent = DataAnalysisAgent()
 
+with open("static/css/style.css", encoding="utf-8") as f:
+    _CSS = f.read()
+
 
 # ------------------------------------------------------------------
 # Gradio interface
@@ -24,7 +27,7 @@ def create_interface():
     with gr.Blocks(
         title="L'Oréal 数据洞察 Agent",
         theme=gr.themes.Soft(),
-        css=open("static/css/style.css").read(),
+        css=_CSS,
     ) as interface:
 
         # Header
@@ -137,8 +140,12 @@ def create_interface():
 
             yield history, status, ""
 
-            result = agent.process_query(user_message)
-            response = result["response"]
+            history.append({"role": "assistant", "content": ""})
+            result = {}
+            for result in agent.process_query_stream(user_message):
+                history[-1]["content"] = result["response"]
+                yield history, "**正在生成回答…** ✍️", ""
+
             images = result.get("images", [])
             tool_results = result.get("tool_results", [])
 
@@ -150,8 +157,6 @@ def create_interface():
                 )
             log_text = "\n".join(log_lines) if log_lines else "无工具调用"
 
-            history.append({"role": "assistant", "content": response})
-
             for img in images:
                 if img and os.path.exists(img):
                     history.append({"role": "assistant", "content": {"path": img}})
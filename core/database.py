@@ -1,15 +1,66 @@
+import math
+import os
 import sqlite3
+import threading
 from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
 from langchain_community.utilities import SQLDatabase
 
+try:  # optional: Arrow-backed reads for large analytical results
+    import connectorx as cx
+except ImportError:
+    cx = None
+
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
 _DEFAULT_DB_URI = "sqlite:///data/order_database.db"
 _DEFAULT_DB_PATH = "data/order_database.db"
+# Columns per compound SELECT; SQLite caps compound terms at 500 by default.
+_UNION_CHUNK = 100
+# Columns per profile_columns() query; each one adds a DISTINCT b-tree.
+_PROFILE_CHUNK = 40
+# Prepared statements kept per connection (sqlite3 defaults to 128); agent
+# retries and cached plans re-run the same SQL text often.
+_STATEMENT_CACHE_SIZE = 512
+
+
+def _quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _db_path_from_uri(db_uri: str) -> str:
+    prefix = "sqlite:///"
+    if db_uri.startswith(prefix):
+        return db_uri[len(prefix):]
+    return _DEFAULT_DB_PATH
+
+
+def _moment_stats(n: int, mean: Optional[float], m2: Optional[float], m3: Optional[float], m4: Optional[float]) -> Dict[str, float]:
+    """Std, skew and excess kurtosis from central moment sums, bias-corrected like pandas."""
+    nan = float("nan")
+    stats = {"count": n, "mean": mean if n else nan, "std": nan, "skew": nan, "kurt": nan}
+    if n >= 2 and m2 is not None:
+        stats["std"] = math.sqrt(m2 / (n - 1))
+    if n >= 3 and m3 is not None:
+        stats["skew"] = 0.0 if m2 == 0 else n * (n - 1) ** 0.5 / (n - 2) * (m3 / m2 ** 1.5)
+    if n >= 4 and m4 is not None:
+        denominator = (n - 2) * (n - 3) * m2 ** 2
+        adj = 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+        stats["kurt"] = 0.0 if denominator == 0 else n * (n + 1) * (n - 1) * m4 / denominator - adj
+    return stats
+
+
+def _numeric_value(col: str) -> str:
+    """SQL expression for ``col`` as a number: numeric-looking TEXT is cast, anything else is NULL."""
+    text = f"trim({col})"
+    return (
+        f"CASE WHEN typeof({col}) IN ('integer', 'real') THEN {col} "
+        f"WHEN typeof({col}) = 'text' AND {text} GLOB '*[0-9]*' AND {text} NOT GLOB '*[^0-9.eE+-]*' "
+        f"THEN CAST({text} AS REAL) END"
+    )
 
 
 class DatabaseManager:
@@ -18,8 +69,37 @@ class DatabaseManager:
     def __init__(self, db_uri: str = _DEFAULT_DB_URI):
         self.db_uri = db_uri
         self.langchain_db = SQLDatabase.from_uri(db_uri)
+        self.db_path = _db_path_from_uri(db_uri)
+        # One connection per thread so independent lookups can run concurrently.
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._table_info_cache: Dict[str, str] = {}
+        self._col_cache: Dict[str, List[Dict[str, Any]]] = {}
+        self._all_columns: Optional[Dict[str, List[Dict[str, Any]]]] = None
         logger.info("DatabaseManager initialised: %s", db_uri)
 
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=_STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA cache_size=-64000")
+        conn.execute("PRAGMA mmap_size=268435456")
+        with self._conns_lock:
+            self._conns.append(conn)
+        return conn
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """The calling thread's connection, opened on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
     # ------------------------------------------------------------------
     # Schema introspection
     # ------------------------------------------------------------------
@@ -27,42 +107,94 @@ class DatabaseManager:
         return self.langchain_db.get_usable_table_names()
 
     def get_table_info(self, table_name: Optional[str] = None) -> str:
-        if table_name:
-            return self.langchain_db.get_table_info([table_name])
-        return self.langchain_db.get_table_info()
+        key = table_name or "__all__"
+        info = self._table_info_cache.get(key)
+        if info is None:
+            if table_name:
+                info = self.langchain_db.get_table_info([table_name])
+            else:
+                info = self.langchain_db.get_table_info()
+            self._table_info_cache[key] = info
+        return info
 
     def get_column_info(self, table_name: str) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(_DEFAULT_DB_PATH)
-        try:
-            cursor = conn.execute(f"PRAGMA table_info('{table_name}')")
-            columns = []
-            for row in cursor.fetchall():
-                columns.append({
-                    "cid": row[0],
-                    "name": row[1],
-                    "type": row[2],
-                    "notnull": bool(row[3]),
-                    "default": row[4],
-                    "pk": bool(row[5]),
+        columns = self.get_all_columns().get(table_name)
+        if columns is None:
+            # Not a plain table (e.g. a view) – introspect it on its own.
+            columns = self._col_cache.get(table_name)
+            if columns is None:
+                columns = self._load_column_info(table_name)
+                self._col_cache[table_name] = columns
+        return columns
+
+    def get_all_columns(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Column info for every table, fetched with a single query."""
+        if self._all_columns is None:
+            rows = self._conn.execute(
+                'SELECT m.name, p.cid, p.name, p.type, p."notnull", p.dflt_value, p.pk '
+                "FROM sqlite_master m JOIN pragma_table_info(m.name) p "
+                "WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite!_%' ESCAPE '!' "
+                "ORDER BY m.name, p.cid"
+            ).fetchall()
+            all_columns: Dict[str, List[Dict[str, Any]]] = {}
+            for row in rows:
+                all_columns.setdefault(row[0], []).append({
+                    "cid": row[1],
+                    "name": row[2],
+                    "type": row[3],
+                    "notnull": bool(row[4]),
+                    "default": row[5],
+                    "pk": bool(row[6]),
                 })
-            return columns
-        finally:
-            conn.close()
+            self._all_columns = all_columns
+        return self._all_columns
+
+    def schema_version(self) -> int:
+        """SQLite's schema cookie; it changes whenever the schema is altered."""
+        return self._conn.execute("PRAGMA schema_version").fetchone()[0]
+
+    def invalidate_schema_cache(self):
+        """Forget cached schema metadata; call after DDL changes."""
+        self._table_info_cache.clear()
+        self._col_cache.clear()
+        self._all_columns = None
+
+    def _load_column_info(self, table_name: str) -> List[Dict[str, Any]]:
+        rows = self._conn.execute(f"PRAGMA table_info('{table_name}')").fetchall()
+        columns = []
+        for row in rows:
+            columns.append({
+                "cid": row[0],
+                "name": row[1],
+                "type": row[2],
+                "notnull": bool(row[3]),
+                "default": row[4],
+                "pk": bool(row[5]),
+            })
+        return columns
 
     def get_sample_data(self, table_name: str, limit: int = 5) -> pd.DataFrame:
-        conn = sqlite3.connect(_DEFAULT_DB_PATH)
-        try:
-            return pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT {limit}", conn)
-        finally:
-            conn.close()
+        return pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT {limit}", self._conn)
 
     def get_row_count(self, table_name: str) -> int:
-        conn = sqlite3.connect(_DEFAULT_DB_PATH)
+        cur = self._conn.execute(f"SELECT COUNT(*) FROM {table_name}")
+        return cur.fetchone()[0]
+
+    def get_row_count_fast(self, table_name: str) -> int:
+        """Row count from ANALYZE statistics, falling back to an exact COUNT(*).
+
+        ``sqlite_stat1`` only exists once ANALYZE has run; its first token is
+        the table's (estimated) row count, so no table scan is needed.
+        """
         try:
-            cur = conn.execute(f"SELECT COUNT(*) FROM {table_name}")
-            return cur.fetchone()[0]
-        finally:
-            conn.close()
+            row = self._conn.execute(
+                "SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table_name,)
+            ).fetchone()
+            if row and row[0]:
+                return int(row[0].split()[0])
+        except (sqlite3.Error, ValueError):
+            pass
+        return self.get_row_count(table_name)
 
     # ------------------------------------------------------------------
     # Query execution
@@ -73,23 +205,179 @@ class DatabaseManager:
         tool = QuerySQLDataBaseTool(db=self.langchain_db)
         return tool.invoke(sql)
 
-    def execute_sql_df(self, sql: str) -> pd.DataFrame:
-        """Execute SQL and return the result as a DataFrame."""
-        conn = sqlite3.connect(_DEFAULT_DB_PATH)
-        try:
-            return pd.read_sql_query(sql, conn)
-        finally:
-            conn.close()
+    def execute_sql_df(self, sql: str, columnar: bool = False) -> pd.DataFrame:
+        """Execute SQL and return the result as a DataFrame.
+
+        With ``columnar=True`` and connectorx installed, the result is read
+        straight into typed column arrays instead of boxing every value in
+        Python; meant for large analytical results. Falls back to the
+        pooled sqlite3 connection on any connectorx error.
+        """
+        if columnar and cx is not None:
+            try:
+                return cx.read_sql(f"sqlite://{os.path.abspath(self.db_path)}", sql, return_type="pandas")
+            except Exception as e:
+                logger.warning("connectorx read failed, using sqlite3: %s", e)
+        return pd.read_sql_query(sql, self._conn)
 
     def get_distinct_values(self, table_name: str, column_name: str, limit: int = 20) -> List[Any]:
-        conn = sqlite3.connect(_DEFAULT_DB_PATH)
-        try:
-            cur = conn.execute(
-                f"SELECT DISTINCT {column_name} FROM {table_name} LIMIT {limit}"
+        cur = self._conn.execute(
+            f"SELECT DISTINCT {column_name} FROM {table_name} LIMIT {limit}"
+        )
+        return [row[0] for row in cur.fetchall()]
+
+    def get_distinct_values_multi(
+        self,
+        table_name: str,
+        columns: List[str],
+        limit: int = 10,
+    ) -> Dict[str, List[Any]]:
+        """Distinct sample values for several columns with one UNION ALL query per chunk."""
+        values: Dict[str, List[Any]] = {c: [] for c in columns}
+        table = _quote_ident(table_name)
+        for start in range(0, len(columns), _UNION_CHUNK):
+            chunk = columns[start:start + _UNION_CHUNK]
+            sql = " UNION ALL ".join(
+                f"SELECT ? AS col_name, v FROM (SELECT DISTINCT {_quote_ident(c)} AS v FROM {table} LIMIT ?)"
+                for c in chunk
             )
-            return [row[0] for row in cur.fetchall()]
-        finally:
-            conn.close()
+            params: List[Any] = []
+            for c in chunk:
+                params.extend((c, limit))
+            try:
+                rows = self._conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError as e:
+                logger.warning("Batched distinct query failed, querying columns one by one: %s", e)
+                for c in chunk:
+                    values[c] = self.get_distinct_values(table_name, c, limit=limit)
+                continue
+            for col_name, v in rows:
+                values[col_name].append(v)
+        return values
+
+    def profile_columns(self, table_name: str, columns: List[str]) -> pd.DataFrame:
+        """Exact distinct and null counts per column, computed by SQLite over the whole table.
+
+        Returns a frame indexed by column name with ``nunique``, ``null_count``
+        and ``total`` columns.
+        """
+        table = _quote_ident(table_name)
+        records = []
+        for start in range(0, len(columns), _PROFILE_CHUNK):
+            chunk = columns[start:start + _PROFILE_CHUNK]
+            select = ", ".join(
+                f"COUNT(DISTINCT {_quote_ident(c)}), SUM({_quote_ident(c)} IS NULL)" for c in chunk
+            )
+            row = self._conn.execute(f"SELECT COUNT(*), {select} FROM {table}").fetchone()
+            total = row[0]
+            for i, c in enumerate(chunk):
+                records.append((c, row[1 + 2 * i], row[2 + 2 * i] or 0, total))
+        return pd.DataFrame.from_records(
+            records, columns=["column", "nunique", "null_count", "total"], index="column"
+        )
+
+    def numeric_summary(self, table_name: str, columns: List[str], iqr_k: float = 1.5) -> pd.DataFrame:
+        """Distribution and IQR-outlier statistics per numeric column, computed in SQLite.
+
+        Quartiles are interpolated linearly and skew/kurtosis use the same
+        bias corrections as pandas, so the numbers match ``Series.describe``
+        / ``skew`` / ``kurt`` on the full column. Numeric-looking TEXT is
+        cast, other values are ignored. Every statement scans the whole
+        table, so callers should bound the row count. Returns a frame indexed
+        by column name.
+        """
+        table = _quote_ident(table_name)
+        records = []
+        for start in range(0, len(columns), _PROFILE_CHUNK):
+            chunk = columns[start:start + _PROFILE_CHUNK]
+            values = [f"v{i}" for i in range(len(chunk))]
+            source = "(SELECT {} FROM {})".format(
+                ", ".join(f"{_numeric_value(_quote_ident(c))} AS {v}" for c, v in zip(chunk, values)), table
+            )
+
+            # Pass 1: counts and means; pass 2: central moment sums around those means.
+            firsts = ", ".join(f"COUNT({v}) AS n{i}, AVG({v}) AS mu{i}" for i, v in enumerate(values))
+            moments = ", ".join(
+                f"SUM(({v} - mu{i}) * ({v} - mu{i})), "
+                f"SUM(({v} - mu{i}) * ({v} - mu{i}) * ({v} - mu{i})), "
+                f"SUM(({v} - mu{i}) * ({v} - mu{i}) * ({v} - mu{i}) * ({v} - mu{i}))"
+                for i, v in enumerate(values)
+            )
+            row = self._conn.execute(
+                f"WITH m AS (SELECT COUNT(*) AS total, {firsts} FROM {source}) "
+                f"SELECT m.*, {moments} FROM {source}, m"
+            ).fetchone()
+
+            total = row[0]
+            counts = [row[1 + 2 * i] or 0 for i in range(len(chunk))]
+            stats = []
+            offset = 1 + 2 * len(chunk)
+            for i, n in enumerate(counts):
+                m2, m3, m4 = row[offset + 3 * i:offset + 3 * i + 3]
+                stats.append(_moment_stats(n, row[2 + 2 * i], m2, m3, m4))
+            for st, q in zip(stats, self._quartiles(source, values, counts, total)):
+                st.update(q)
+
+            bounds = []
+            for st in stats:
+                iqr = st["q3"] - st["q1"]
+                st["lower"], st["upper"] = st["q1"] - iqr_k * iqr, st["q3"] + iqr_k * iqr
+                bounds.extend((st["lower"], st["upper"]))
+            outside = [f"({v} < ? OR {v} > ?)" for v in values]
+            select = ", ".join(
+                f"SUM({o}), MIN(CASE WHEN {o} THEN {v} END), MAX(CASE WHEN {o} THEN {v} END)"
+                for v, o in zip(values, outside)
+            )
+            params: List[Any] = []
+            for i in range(len(chunk)):
+                params.extend(bounds[2 * i:2 * i + 2] * 3)
+            out = self._conn.execute(f"SELECT {select} FROM {source}", params).fetchone()
+
+            for i, (c, st) in enumerate(zip(chunk, stats)):
+                st["outliers"] = out[3 * i] or 0
+                st["outlier_min"], st["outlier_max"] = out[3 * i + 1], out[3 * i + 2]
+                records.append({"column": c, **st})
+        return pd.DataFrame.from_records(records, index="column").astype(float)
+
+    def _quartiles(self, source: str, values: List[str], counts: List[int], total: int) -> List[Dict[str, float]]:
+        """25/50/75% quantiles with pandas' linear interpolation for every column in one scan."""
+        quantiles = (("q1", 0.25), ("median", 0.5), ("q3", 0.75))
+        ranks, ranked, where, params = [], [], [], []
+        for i, (v, n) in enumerate(zip(values, counts)):
+            positions = [(n - 1) * q for _, q in quantiles]
+            wanted = sorted({int(p) for p in positions} | {min(int(p) + 1, n - 1) for p in positions}) if n else []
+            ranks.append(wanted)
+            # NULLs sort first, so subtracting their count gives the 0-based rank among values.
+            ranked.append(f"{v}, ROW_NUMBER() OVER (ORDER BY {v}) - 1 - {total - n} AS r{i}")
+            if wanted:
+                where.append(f"r{i} IN ({','.join('?' * len(wanted))})")
+                params.extend(wanted)
+
+        at: List[Dict[int, float]] = [{} for _ in values]
+        if where:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(f'r{i}, {v}' for i, v in enumerate(values))} "
+                f"FROM (SELECT {', '.join(ranked)} FROM {source}) WHERE {' OR '.join(where)}",
+                params,
+            ).fetchall()
+            for row in rows:
+                for i in range(len(values)):
+                    if row[2 * i] in ranks[i]:
+                        at[i][row[2 * i]] = row[2 * i + 1]
+
+        results = []
+        for i, n in enumerate(counts):
+            result = {}
+            for name, q in quantiles:
+                if n == 0:
+                    result[name] = float("nan")
+                    continue
+                pos = (n - 1) * q
+                lo = int(pos)
+                hi = min(lo + 1, n - 1)
+                result[name] = at[i][lo] + (pos - lo) * (at[i][hi] - at[i][lo])
+            results.append(result)
+        return results
 
     def get_numeric_columns(self, table_name: str) -> List[str]:
         cols = self.get_column_info(table_name)
@@ -106,3 +394,12 @@ class DatabaseManager:
             c["name"] for c in cols
             if any(t in c["type"].upper() for t in date_types)
         ]
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def close(self):
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
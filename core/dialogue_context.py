@@ -1,5 +1,7 @@
+import itertools
+from collections import deque
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Deque, Dict, List, Optional
 
 from utils.logger import get_logger
 
@@ -10,7 +12,7 @@ class DialogueContext:
     """Manages conversation history and metadata for multi-turn interactions."""
 
     def __init__(self, max_history: int = 50):
-        self.messages: List[Dict[str, Any]] = []
+        self.messages: Deque[Dict[str, Any]] = deque(maxlen=max_history)
         self.max_history = max_history
         self.current_session_id: Optional[str] = None
         self.session_start_time: Optional[datetime] = None
@@ -18,7 +20,7 @@ class DialogueContext:
     def start_new_session(self) -> str:
         self.current_session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.session_start_time = datetime.now()
-        self.messages = []
+        self.messages.clear()
         logger.info("Started new dialogue session: %s", self.current_session_id)
         return self.current_session_id
 
@@ -39,11 +41,9 @@ class DialogueContext:
         }
         self.messages.append(message)
 
-        if len(self.messages) > self.max_history:
-            self.messages = self.messages[-self.max_history:]
-
     def get_context_window(self, window_size: int = 10) -> List[Dict[str, Any]]:
-        return self.messages[-window_size:] if self.messages else []
+        start = max(0, len(self.messages) - window_size)
+        return list(itertools.islice(self.messages, start, None))
 
     def get_formatted_history(self, window_size: int = 10) -> str:
         recent = self.get_context_window(window_size)
@@ -56,10 +56,10 @@ class DialogueContext:
         return "\n".join(lines)
 
     def get_all_messages(self) -> List[Dict[str, Any]]:
-        return self.messages
+        return list(self.messages)
 
     def clear_context(self):
-        self.messages = []
+        self.messages.clear()
         self.current_session_id = None
         self.session_start_time = None
         logger.info("Cleared dialogue context")
@@ -0,0 +1,112 @@
+import re
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Numbers and quoted strings: paraphrases that differ only in these still
+# embed close together, but ask for different data.
+_LITERAL_RE = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"|“[^”]*”|‘[^’]*’|「[^」]*」")
+
+_encoders: Dict[str, Any] = {}
+_failed_models: Set[str] = set()
+_encoder_lock = threading.Lock()
+
+
+def get_encoder(model_name: str):
+    """Shared sentence-transformers model, loaded once per process.
+
+    Returns ``None`` when sentence-transformers or the model is unavailable;
+    callers then fall back to exact matching.
+    """
+    with _encoder_lock:
+        encoder = _encoders.get(model_name)
+        if encoder is None and model_name not in _failed_models:
+            try:
+                from sentence_transformers import SentenceTransformer
+                encoder = _encoders[model_name] = SentenceTransformer(model_name)
+            except Exception as e:
+                logger.warning("Embedding model %s unavailable, using exact match only: %s", model_name, e)
+                _failed_models.add(model_name)
+        return encoder
+
+
+def warm_up(model_name: str):
+    """Load ``model_name`` on a background thread."""
+    threading.Thread(target=get_encoder, args=(model_name,), name="embedding-warmup", daemon=True).start()
+
+
+def literal_signature(text: str) -> Tuple[str, ...]:
+    """Numbers and quoted literals in ``text``, in order; similar texts must share it to match."""
+    return tuple(_LITERAL_RE.findall(text))
+
+
+def embed(model_name: str, text: str) -> Optional[np.ndarray]:
+    """Unit-norm float32 embedding of ``text``, or ``None`` without a model."""
+    encoder = get_encoder(model_name)
+    if encoder is None:
+        return None
+    return np.asarray(encoder.encode(text, normalize_embeddings=True), dtype=np.float32)
+
+
+class EmbeddingIndex:
+    """Fixed-capacity nearest-neighbour index over unit-norm embeddings.
+
+    Rows live in one contiguous float32 matrix, so a search is a single
+    matrix-vector product (the same thing as a flat inner-product index).
+    Eviction is left to the caller: ``add`` fails once ``capacity`` keys
+    are stored.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self._key_rows)
+
+    def add(self, key: Hashable, vec: np.ndarray):
+        with self._lock:
+            self._remove(key)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.capacity, vec.shape[0]), dtype=np.float32)
+            row = self._free_rows.pop()
+            self._matrix[row] = vec
+            self._row_keys[row] = key
+            self._key_rows[key] = row
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: Hashable):
+        row = self._key_rows.pop(key, None)
+        if row is None:
+            return
+        self._matrix[row] = 0.0
+        self._row_keys[row] = None
+        self._free_rows.append(row)
+
+    def search(self, vec: np.ndarray) -> Optional[Tuple[Hashable, float]]:
+        """The stored key most similar to ``vec`` and its cosine similarity."""
+        with self._lock:
+            if self._matrix is None or not self._key_rows:
+                return None
+            sims = self._matrix @ vec
+            row = int(sims.argmax())
+            key = self._row_keys[row]
+            if key is None:
+                return None
+            return key, float(sims[row])
+
+    def clear(self):
+        with self._lock:
+            self._matrix: Optional[np.ndarray] = None
+            self._row_keys: List[Optional[Hashable]] = [None] * self.capacity
+            self._key_rows: Dict[Hashable, int] = {}
+            self._free_rows: List[int] = list(range(self.capacity - 1, -1, -1))
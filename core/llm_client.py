@@ -1,22 +1,116 @@
+import hashlib
 import json
 import os
-from typing import Any, Dict, List, Optional, Tuple
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
+import orjson
 from langchain_core.callbacks import CallbackManagerForLLMRun
 from langchain_core.language_models.llms import LLM
 from openai import OpenAI
 from dotenv import load_dotenv
+from pydantic import PrivateAttr
 
+from utils.cache import CACHE_DIR, SQLiteCache
 from utils.logger import get_logger
 
 load_dotenv()
 logger = get_logger(__name__)
 
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+_JSON_ARRAY_RE = re.compile(r"\[.*\]", re.DOTALL)
+
+_RESPONSE_CACHE_SIZE = 512
+_RESPONSE_CACHE_TTL = 3600
+# Completions also persist on disk so restarts keep their cache.
+_DISK_CACHE_PATH = os.path.join(CACHE_DIR, "llm_responses.db")
+_DISK_CACHE_TTL = 24 * 3600
+_disk_cache: Optional[SQLiteCache] = None
+
+# (model, serialised messages, temperature) -> (timestamp, content)
+_response_cache: "OrderedDict[Tuple[str, bytes, Optional[float]], Tuple[float, str]]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+def _cache_key(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: Optional[float],
+) -> Tuple[str, bytes, Optional[float]]:
+    # Surrounding whitespace never changes the answer, so it should not change the key.
+    normalised = [
+        {**m, "content": m["content"].strip()} if isinstance(m.get("content"), str) else m
+        for m in messages
+    ]
+    return model, orjson.dumps(normalised, option=orjson.OPT_SORT_KEYS), temperature
+
+
+def _get_disk_cache() -> SQLiteCache:
+    global _disk_cache
+    if _disk_cache is None:
+        with _response_cache_lock:
+            if _disk_cache is None:
+                _disk_cache = SQLiteCache(_DISK_CACHE_PATH, table="llm_cache")
+    return _disk_cache
+
+
+def _disk_key(key: Tuple[str, bytes, Optional[float]]) -> str:
+    model, messages, temperature = key
+    raw = b"|".join((model.encode("utf-8"), messages, repr(temperature).encode("ascii")))
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _json_loads(text: str) -> Any:
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        # The stdlib parser is more lenient (e.g. NaN literals).
+        return json.loads(text)
+
+
+def _cache_get(key: Tuple[str, bytes, Optional[float]]) -> Optional[str]:
+    with _response_cache_lock:
+        entry = _response_cache.get(key)
+        if entry is not None:
+            ts, content = entry
+            if time.monotonic() - ts <= _RESPONSE_CACHE_TTL:
+                _response_cache.move_to_end(key)
+                return content
+            del _response_cache[key]
+    content = _get_disk_cache().get(_disk_key(key))
+    if content is not None:
+        _memory_put(key, content)
+    return content
+
+
+def _cache_put(key: Tuple[str, bytes, Optional[float]], content: str):
+    _memory_put(key, content)
+    _get_disk_cache().set(_disk_key(key), content, ttl=_DISK_CACHE_TTL)
+
+
+def _memory_put(key: Tuple[str, bytes, Optional[float]], content: str):
+    with _response_cache_lock:
+        _response_cache[key] = (time.monotonic(), content)
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > _RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+
+def format_tool_descriptions(tool_descriptions: List[Dict[str, str]]) -> str:
+    return "\n".join(
+        f"- **{t['name']}**: {t['description']}  参数: {t.get('parameters', '无')}"
+        for t in tool_descriptions
+    )
+
 
 class LLMClient(LLM):
     """Enhanced LLM client with function-calling support for the agent."""
 
     model_name: str = "Qwen/Qwen2.5-Coder-32B-Instruct"
+    _client: Optional[OpenAI] = PrivateAttr(default=None)
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -26,10 +120,20 @@ class LLMClient(LLM):
         return "silicon_flow"
 
     def _get_client(self) -> OpenAI:
-        return OpenAI(
-            api_key=os.environ.get("API_KEY"),
-            base_url=os.environ.get("BASE_URL"),
-        )
+        # Reuse one client so its httpx pool keeps connections alive across calls.
+        if self._client is None:
+            self._client = OpenAI(
+                api_key=os.environ.get("API_KEY"),
+                base_url=os.environ.get("BASE_URL"),
+            )
+        return self._client
+
+    @staticmethod
+    def clear_cache():
+        """Drop all memoised chat completions, in memory and on disk."""
+        with _response_cache_lock:
+            _response_cache.clear()
+        _get_disk_cache().clear()
 
     # ------------------------------------------------------------------
     # Core LLM call (used by LangChain chains)
@@ -42,18 +146,20 @@ class LLMClient(LLM):
         **kwargs: Any,
     ) -> str:
         try:
-            client = self._get_client()
-            response = client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-            )
-            content = ""
-            if hasattr(response, "choices") and response.choices:
-                for choice in response.choices:
-                    if hasattr(choice, "message") and hasattr(choice.message, "content"):
-                        content += choice.message.content
-            else:
-                return "Error: LLM did not return a valid response."
+            messages = [{"role": "user", "content": prompt}]
+            key = _cache_key(self.model_name, messages, None)
+            content = _cache_get(key)
+            if content is None:
+                client = self._get_client()
+                response = client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                )
+                if not response.choices:
+                    return "Error: LLM did not return a valid response."
+                content = response.choices[0].message.content or ""
+                if content:
+                    _cache_put(key, content)
             if stop is not None:
                 for s in stop:
                     if s in content:
@@ -67,6 +173,10 @@ class LLMClient(LLM):
     # Chat-style call with message list
     # ------------------------------------------------------------------
     def chat(self, messages: List[Dict[str, str]], temperature: float = 0.1) -> str:
+        key = _cache_key(self.model_name, messages, temperature)
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached
         client = self._get_client()
         response = client.chat.completions.create(
             model=self.model_name,
@@ -74,27 +184,59 @@ class LLMClient(LLM):
             temperature=temperature,
         )
         if response.choices:
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            if content:
+                _cache_put(key, content)
+            return content
         return ""
 
+    def chat_stream(self, messages: List[Dict[str, str]], temperature: float = 0.1) -> Iterator[str]:
+        """Like ``chat`` but yields the completion incrementally."""
+        key = _cache_key(self.model_name, messages, temperature)
+        cached = _cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+        client = self._get_client()
+        stream = client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+        )
+        parts: List[str] = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        content = "".join(parts)
+        if content:
+            _cache_put(key, content)
+
     # ------------------------------------------------------------------
     # Agent-oriented: choose tools given a query
     # ------------------------------------------------------------------
     def plan_tools(
         self,
         user_query: str,
-        tool_descriptions: List[Dict[str, str]],
+        tool_descriptions: Union[str, List[Dict[str, str]]],
         conversation_history: str = "",
         data_schema: str = "",
     ) -> List[Dict[str, Any]]:
         """Ask the LLM to produce an ordered list of tool calls (ReAct-style).
 
+        ``tool_descriptions`` may be pre-rendered text (see
+        ``ToolRegistry.descriptions_text``) or a list of description dicts.
+
         Returns a list of dicts: [{"tool": "<name>", "args": {...}, "reason": "..."}]
         """
-        tools_text = "\n".join(
-            f"- **{t['name']}**: {t['description']}  参数: {t.get('parameters', '无')}"
-            for t in tool_descriptions
-        )
+        if isinstance(tool_descriptions, str):
+            tools_text = tool_descriptions
+        else:
+            tools_text = format_tool_descriptions(tool_descriptions)
 
         prompt = f"""你是一位专业的数据分析Agent。根据用户的查询，你需要决定调用哪些工具来完成分析任务。
 
@@ -136,22 +278,19 @@ class LLMClient(LLM):
         """Parse the JSON tool plan from LLM response."""
         try:
             text = response.strip()
-            if "```json" in text:
-                text = text.split("```json", 1)[1]
-            if "```" in text:
-                text = text.split("```", 1)[0]
-            text = text.strip()
-            plan = json.loads(text)
+            fenced = _JSON_FENCE_RE.search(text)
+            if fenced:
+                text = fenced.group(1).strip()
+            plan = _json_loads(text)
             if isinstance(plan, list):
                 return plan
             return [plan]
         except json.JSONDecodeError:
             logger.warning("Failed to parse tool plan JSON, attempting recovery: %s", response[:300])
             try:
-                import re
-                match = re.search(r'\[.*\]', response, re.DOTALL)
+                match = _JSON_ARRAY_RE.search(response)
                 if match:
-                    return json.loads(match.group())
+                    return _json_loads(match.group())
             except Exception:
                 pass
             return [{"tool": "general_chat", "args": {"message": response}, "reason": "解析失败，作为普通对话处理"}]
@@ -165,15 +304,34 @@ class LLMClient(LLM):
         tool_results: List[Dict[str, Any]],
         conversation_history: str = "",
     ) -> str:
-        results_text = ""
+        prompt = self._summary_prompt(user_query, tool_results, conversation_history)
+        return self.chat([{"role": "user", "content": prompt}])
+
+    def summarise_results_stream(
+        self,
+        user_query: str,
+        tool_results: List[Dict[str, Any]],
+        conversation_history: str = "",
+    ) -> Iterator[str]:
+        prompt = self._summary_prompt(user_query, tool_results, conversation_history)
+        return self.chat_stream([{"role": "user", "content": prompt}])
+
+    @staticmethod
+    def _summary_prompt(
+        user_query: str,
+        tool_results: List[Dict[str, Any]],
+        conversation_history: str = "",
+    ) -> str:
+        parts: List[str] = []
         for i, r in enumerate(tool_results, 1):
-            results_text += f"\n### 步骤 {i}: {r.get('tool', 'unknown')} \n"
-            results_text += f"**原因**: {r.get('reason', '')}\n"
-            results_text += f"**结果**: {r.get('result', '')}\n"
+            parts.append(f"\n### 步骤 {i}: {r.get('tool', 'unknown')} \n")
+            parts.append(f"**原因**: {r.get('reason', '')}\n")
+            parts.append(f"**结果**: {r.get('result', '')}\n")
             if r.get("image_path"):
-                results_text += f"**图表**: 已生成图表 {r['image_path']}\n"
+                parts.append(f"**图表**: 已生成图表 {r['image_path']}\n")
+        results_text = "".join(parts)
 
-        prompt = f"""你是欧莱雅集团的智能数据分析助手 BeautyInsight。
+        return f"""你是欧莱雅集团的智能数据分析助手 BeautyInsight。
 请基于以下分析结果，为用户生成一份专业、易懂的分析报告。
 
 ## 对话历史
@@ -193,11 +351,16 @@ class LLMClient(LLM):
 5. 适当给出业务建议或进一步分析方向
 6. 格式清晰，使用适当的标题和列表"""
 
-        return self.chat([{"role": "user", "content": prompt}])
-
     def general_chat(self, question: str) -> str:
         """Handle non-data-related conversations."""
-        prompt = f"""你是欧莱雅集团的智能数据分析助手 BeautyInsight，专注于美妆行业数据分析。
+        return self.chat([{"role": "user", "content": self._general_chat_prompt(question)}])
+
+    def general_chat_stream(self, question: str) -> Iterator[str]:
+        return self.chat_stream([{"role": "user", "content": self._general_chat_prompt(question)}])
+
+    @staticmethod
+    def _general_chat_prompt(question: str) -> str:
+        return f"""你是欧莱雅集团的智能数据分析助手 BeautyInsight，专注于美妆行业数据分析。
 
 专业领域：
 - 精通欧莱雅集团的销售数据分析
@@ -210,5 +373,3 @@ class LLMClient(LLM):
 - 用专业、友好的语言回答
 - 如果用户询问功能，介绍数据分析和可视化能力并举例
 - 适时建议可以进行的深入分析"""
-
-        return self.chat([{"role": "user", "content": prompt}])
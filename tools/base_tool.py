@@ -1,10 +1,18 @@
+import re
 from abc import ABC, abstractmethod
 from typing import Any, Dict, Optional
 
+import pandas as pd
+
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+_SQL_FENCE_RE = re.compile(r"```(?:sql)?[^\S\n]*\n?(.*?)(?:```|\Z)", re.IGNORECASE | re.DOTALL)
+_SQL_START_RE = re.compile(r"\A\s*WITH\b|\bSELECT\b", re.IGNORECASE)
+# Everything up to the first semicolon outside a quoted literal.
+_SQL_STATEMENT_RE = re.compile(r"(?:'[^']*'|\"[^\"]*\"|[^;])*")
+
 
 class BaseTool(ABC):
     """Abstract base class that every analysis tool must extend."""
@@ -12,6 +20,11 @@ class BaseTool(ABC):
     name: str = "base_tool"
     description: str = "Base tool"
     parameters_description: str = "无"
+    # Identical calls within one query may share a result; tools with side
+    # effects should set this to False.
+    idempotent: bool = True
+    # Whether the agent may run this tool concurrently with other steps.
+    thread_safe: bool = True
 
     @abstractmethod
     def execute(self, **kwargs) -> Dict[str, Any]:
@@ -49,3 +62,33 @@ class BaseTool(ABC):
                 "success": False,
                 "result": f"工具 {self.name} 执行失败: {str(e)}",
             }
+
+
+def _md_cell(value: Any) -> str:
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+
+def df_to_md(df: pd.DataFrame, index: bool = False) -> str:
+    """Render ``df`` as a markdown table without going through tabulate."""
+    header = ([df.index.name or ""] if index else []) + list(df.columns)
+    lines = [
+        "| " + " | ".join(map(_md_cell, header)) + " |",
+        "|" + "|".join(["---"] * len(header)) + "|",
+    ]
+    lines.extend("| " + " | ".join(map(_md_cell, row)) + " |" for row in df.itertuples(index=index, name=None))
+    return "\n".join(lines)
+
+
+def extract_sql(text: str) -> Optional[str]:
+    """First SQL statement in an LLM reply, or ``None``.
+
+    A fenced code block wins over any SELECT in the surrounding prose; the
+    statement ends at the first semicolon outside a string literal.
+    """
+    fence = _SQL_FENCE_RE.search(text)
+    for candidate in ((fence.group(1).strip(),) if fence else ()) + (text.strip(),):
+        m = _SQL_START_RE.search(candidate)
+        if m is not None:
+            sql = _SQL_STATEMENT_RE.match(candidate, m.start()).group().strip()
+            return sql or None
+    return None
@@ -1,13 +1,19 @@
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
 
 import pandas as pd
 
 from core.database import DatabaseManager
-from tools.base_tool import BaseTool
+from tools.base_tool import BaseTool, df_to_md
+from utils.cache import TTLCache
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+SCHEMA_CACHE_TTL = 60
+
+_IO_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="db-io")
+
 
 class DataInspectorTool(BaseTool):
     """Inspect database schema, understand table headers and data structure."""
@@ -23,12 +29,23 @@ class DataInspectorTool(BaseTool):
 
     def __init__(self, db: DatabaseManager):
         self.db = db
+        self._schema_cache = TTLCache(ttl=SCHEMA_CACHE_TTL)
+
+    def _cached(self, table_name: str, method: str, fn: Callable[[], Any]) -> Any:
+        return self._schema_cache.get_or_load((table_name, method), fn)
+
+    def invalidate(self, table_name: Optional[str] = None):
+        """Forget cached lookups for one table, or all of them; call after DDL."""
+        if table_name is None:
+            self._schema_cache.invalidate()
+        else:
+            self._schema_cache.invalidate(lambda key: key[0] == table_name)
 
     def execute(self, **kwargs) -> Dict[str, Any]:
         table_name = kwargs.get("table_name")
         inspect_type = kwargs.get("inspect_type", "overview")
 
-        tables = self.db.get_table_names()
+        tables = self._cached("", "table_names", self.db.get_table_names)
         if not table_name:
             table_name = tables[0] if tables else None
         if not table_name:
@@ -44,48 +61,52 @@ class DataInspectorTool(BaseTool):
             return self._inspect_overview(table_name)
 
     def _inspect_schema(self, table_name: str) -> Dict[str, Any]:
-        columns = self.db.get_column_info(table_name)
-        schema_text = f"## 表 `{table_name}` 结构\n\n"
-        schema_text += "| 序号 | 字段名 | 类型 | 非空 | 主键 |\n"
-        schema_text += "|------|--------|------|------|------|\n"
+        columns = self._cached(table_name, "columns", lambda: self.db.get_column_info(table_name))
+        parts = [
+            f"## 表 `{table_name}` 结构\n\n",
+            "| 序号 | 字段名 | 类型 | 非空 | 主键 |\n",
+            "|------|--------|------|------|------|\n",
+        ]
         for col in columns:
-            schema_text += (
+            parts.append(
                 f"| {col['cid']} | {col['name']} | {col['type']} "
                 f"| {'是' if col['notnull'] else '否'} "
                 f"| {'是' if col['pk'] else '否'} |\n"
             )
         return {
             "success": True,
-            "result": schema_text,
+            "result": "".join(parts),
             "data": {"table_name": table_name, "columns": columns},
         }
 
     def _inspect_sample(self, table_name: str) -> Dict[str, Any]:
-        df = self.db.get_sample_data(table_name, limit=5)
+        df = self._cached(table_name, "sample_5", lambda: self.db.get_sample_data(table_name, limit=5))
         sample_text = f"## 表 `{table_name}` 数据样例（前5行）\n\n"
-        sample_text += df.to_markdown(index=False)
+        sample_text += df_to_md(df)
         return {
             "success": True,
             "result": sample_text,
-            "data": {"table_name": table_name, "sample": df.to_dict()},
+            "data": {"table_name": table_name, "sample": df.to_dict(orient="list")},
             "dataframe": df,
         }
 
     def _inspect_column_detail(self, table_name: str, column_name: str = None) -> Dict[str, Any]:
-        columns = self.db.get_column_info(table_name)
+        columns = self._cached(table_name, "columns", lambda: self.db.get_column_info(table_name))
         if column_name:
             columns = [c for c in columns if c["name"] == column_name]
             if not columns:
                 return {"success": False, "result": f"未找到列: {column_name}"}
 
+        distinct = self.db.get_distinct_values_multi(table_name, [c["name"] for c in columns], limit=10)
         result_parts = []
         for col in columns:
             col_name = col["name"]
-            distinct_vals = self.db.get_distinct_values(table_name, col_name, limit=10)
-            part = f"### 字段: `{col_name}`\n"
-            part += f"- 类型: {col['type']}\n"
-            part += f"- 示例值: {distinct_vals}\n"
-            result_parts.append(part)
+            distinct_vals = distinct[col_name]
+            result_parts.append(
+                f"### 字段: `{col_name}`\n"
+                f"- 类型: {col['type']}\n"
+                f"- 示例值: {distinct_vals}\n"
+            )
 
         return {
             "success": True,
@@ -94,25 +115,38 @@ class DataInspectorTool(BaseTool):
         }
 
     def _inspect_overview(self, table_name: str) -> Dict[str, Any]:
-        row_count = self.db.get_row_count(table_name)
-        columns = self.db.get_column_info(table_name)
-        numeric_cols = self.db.get_numeric_columns(table_name)
-        date_cols = self.db.get_date_columns(table_name)
-        sample = self.db.get_sample_data(table_name, limit=3)
-
-        text = f"## 数据概览: `{table_name}`\n\n"
-        text += f"- **总行数**: {row_count:,}\n"
-        text += f"- **总列数**: {len(columns)}\n"
-        text += f"- **数值型字段** ({len(numeric_cols)}): {', '.join(numeric_cols)}\n"
-        text += f"- **日期型字段** ({len(date_cols)}): {', '.join(date_cols)}\n\n"
-        text += "### 字段列表\n"
-        for col in columns:
-            text += f"- `{col['name']}` ({col['type']})\n"
-        text += f"\n### 数据样例（前3行）\n{sample.to_markdown(index=False)}\n"
+        # Independent lookups; DatabaseManager gives each pool thread its own connection.
+        lookups = {
+            "row_count": lambda: self.db.get_row_count_fast(table_name),
+            "columns": lambda: self.db.get_column_info(table_name),
+            "numeric_columns": lambda: self.db.get_numeric_columns(table_name),
+            "date_columns": lambda: self.db.get_date_columns(table_name),
+            "sample_3": lambda: self.db.get_sample_data(table_name, limit=3),
+        }
+        futures = {
+            method: _IO_POOL.submit(self._cached, table_name, method, fn) for method, fn in lookups.items()
+        }
+        row_count = futures["row_count"].result()
+        columns = futures["columns"].result()
+        numeric_cols = futures["numeric_columns"].result()
+        date_cols = futures["date_columns"].result()
+        sample = futures["sample_3"].result()
+
+        parts = [
+            f"## 数据概览: `{table_name}`\n\n",
+            # Taken from ANALYZE statistics, which can lag behind later writes.
+            f"- **总行数(约)**: {row_count:,}\n",
+            f"- **总列数**: {len(columns)}\n",
+            f"- **数值型字段** ({len(numeric_cols)}): {', '.join(numeric_cols)}\n",
+            f"- **日期型字段** ({len(date_cols)}): {', '.join(date_cols)}\n\n",
+            "### 字段列表\n",
+        ]
+        parts.extend(f"- `{col['name']}` ({col['type']})\n" for col in columns)
+        parts.append(f"\n### 数据样例（前3行）\n{df_to_md(sample)}\n")
 
         return {
             "success": True,
-            "result": text,
+            "result": "".join(parts),
             "data": {
                 "table_name": table_name,
                 "row_count": row_count,
@@ -1,13 +1,21 @@
-from typing import Any, Dict
+import random
+from typing import Any, Dict, List, Optional
 
 import pandas as pd
 
 from core.database import DatabaseManager
-from tools.base_tool import BaseTool
+from tools.base_tool import BaseTool, df_to_md
+from utils.cache import TTLCache
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+METADATA_CACHE_TTL = 60
+SAMPLE_SIZE = 5000
+# Above this many rows the full-table SQL summary (several scans plus a sort
+# per column) costs more than it is worth; profile a sample instead.
+SQL_SUMMARY_MAX_ROWS = 50_000
+
 
 class DataProfilingTool(BaseTool):
     """Profile a table: missing values, distributions, outliers, data quality."""
@@ -25,76 +33,127 @@ class DataProfilingTool(BaseTool):
 
     def __init__(self, db: DatabaseManager):
         self.db = db
+        self._metadata_cache = TTLCache(ttl=METADATA_CACHE_TTL)
+
+    def invalidate(self, table_name: Optional[str] = None):
+        """Forget cached table metadata for one table, or all of them."""
+        if table_name is None:
+            self._metadata_cache.invalidate()
+        else:
+            self._metadata_cache.invalidate(lambda key: key[0] == table_name)
 
     def execute(self, **kwargs) -> Dict[str, Any]:
         table_name = kwargs.get("table_name")
         profile_type = kwargs.get("profile_type", "full")
         column_name = kwargs.get("column_name")
 
-        tables = self.db.get_table_names()
+        tables = self._metadata_cache.get_or_load(("", "table_names"), self.db.get_table_names)
         if not table_name:
             table_name = tables[0] if tables else None
         if not table_name:
             return {"success": False, "result": "没有可用的数据表"}
 
-        row_count = self.db.get_row_count(table_name)
-        sample_size = min(row_count, 5000)
-        df = self.db.execute_sql_df(
-            f"SELECT * FROM {table_name} ORDER BY RANDOM() LIMIT {sample_size}"
-        )
+        if profile_type in ("missing", "unique"):
+            # Exact counts straight from SQLite; no sample needed.
+            columns = self._metadata_cache.get_or_load(
+                (table_name, "columns"), lambda: self.db.get_column_info(table_name)
+            )
+            profile = self._metadata_cache.get_or_load(
+                (table_name, "column_profile"),
+                lambda: self.db.profile_columns(table_name, [c["name"] for c in columns]),
+            )
+            if profile_type == "missing":
+                return self._missing_analysis(profile, table_name)
+            return self._unique_analysis(profile, columns, table_name)
 
-        if profile_type == "missing":
-            return self._missing_analysis(df, table_name, row_count)
-        elif profile_type == "distribution":
-            return self._distribution_analysis(df, table_name, column_name)
-        elif profile_type == "outliers":
-            return self._outlier_analysis(df, table_name)
-        elif profile_type == "unique":
-            return self._unique_analysis(df, table_name)
-        else:
-            return self._full_profile(df, table_name, row_count)
+        summary = None
+        if profile_type in ("distribution", "outliers"):
+            summary = self._numeric_summary(table_name, profile_type, column_name)
+
+        if summary is None:
+            row_count = self._metadata_cache.get_or_load(
+                (table_name, "row_count"), lambda: self.db.get_row_count_fast(table_name)
+            )
+            df = self._load_sample(table_name, row_count, SAMPLE_SIZE)
+            if profile_type == "distribution":
+                cols = [column_name] if column_name and column_name in df.columns else df.select_dtypes(include="number").columns[:5]
+                summary = self._sample_summary(df, cols)
+            elif profile_type == "outliers":
+                summary = self._sample_summary(df, df.select_dtypes(include="number").columns)
+            else:
+                return self._full_profile(df, table_name, row_count)
+
+        if profile_type == "distribution":
+            return self._distribution_analysis(summary, table_name)
+        return self._outlier_analysis(summary, table_name)
+
+    def _load_sample(self, table_name: str, row_count: int, sample_size: int) -> pd.DataFrame:
+        """Random sample of about ``sample_size`` rows without sorting the whole table."""
+        # row_count is the ANALYZE estimate and may be stale, so every read stays bounded.
+        if row_count <= 2 * sample_size:
+            df = self.db.execute_sql_df(f"SELECT * FROM {table_name} LIMIT {2 * sample_size}")
+            return df.sample(n=sample_size) if len(df) > sample_size else df
+
+        try:
+            max_rowid = int(self.db.execute_sql_df(f"SELECT MAX(rowid) AS m FROM {table_name}")["m"].iloc[0])
+            # Over-draw slightly so rowid gaps still leave enough hits.
+            k = min(max_rowid, int(sample_size * max_rowid / row_count * 1.1) + 1, 4 * sample_size)
+            rowids = ",".join(map(str, random.sample(range(1, max_rowid + 1), k)))
+            df = self.db.execute_sql_df(f"SELECT * FROM {table_name} WHERE rowid IN ({rowids})")
+        except Exception as e:
+            logger.warning("Rowid sampling failed for %s, falling back to ORDER BY RANDOM(): %s", table_name, e)
+            return self.db.execute_sql_df(
+                f"SELECT * FROM {table_name} ORDER BY RANDOM() LIMIT {sample_size}"
+            )
+        return df.sample(n=sample_size) if len(df) > sample_size else df
 
     # ------------------------------------------------------------------
     def _full_profile(self, df: pd.DataFrame, table_name: str, total_rows: int) -> Dict[str, Any]:
-        text = f"## 数据画像: `{table_name}`\n\n"
-        text += f"- 总行数: {total_rows:,}\n"
-        text += f"- 采样量: {len(df):,}\n"
-        text += f"- 总列数: {len(df.columns)}\n\n"
-
-        missing = df.isnull().sum()
-        missing_pct = (missing / len(df) * 100).round(1)
-        text += "### 缺失值概况\n\n"
-        text += "| 字段 | 缺失数 | 缺失率 |\n|------|--------|--------|\n"
+        n = len(df)
+        missing = df.isna().sum()
+        missing_pct = (missing * 100 / n).round(1)
+
+        parts = [
+            f"## 数据画像: `{table_name}`\n\n",
+            f"- 总行数(约): {total_rows:,}\n",
+            f"- 采样量: {n:,}\n",
+            f"- 总列数: {len(df.columns)}\n\n",
+            "### 缺失值概况\n\n",
+            "| 字段 | 缺失数 | 缺失率 |\n|------|--------|--------|\n",
+        ]
         for col in df.columns:
             if missing[col] > 0:
-                text += f"| {col} | {missing[col]} | {missing_pct[col]}% |\n"
-        if missing.sum() == 0:
-            text += "| (所有字段) | 0 | 0% |\n"
+                parts.append(f"| {col} | {missing[col]} | {missing_pct[col]}% |\n")
+        if not (missing > 0).any():
+            parts.append("| (所有字段) | 0 | 0% |\n")
 
-        text += "\n### 数值列统计\n\n"
+        parts.append("\n### 数值列统计\n\n")
         numeric = df.select_dtypes(include="number")
         if not numeric.empty:
             stats = numeric.describe().round(2)
-            text += stats.to_markdown() + "\n"
+            parts.append(df_to_md(stats, index=True) + "\n")
 
-        text += "\n### 分类列统计\n\n"
-        categorical = df.select_dtypes(include="object")
-        for col in categorical.columns[:10]:
-            nunique = df[col].nunique()
+        parts.append("\n### 分类列统计\n\n")
+        cat_cols = df.select_dtypes(include="object").columns[:10]
+        nuniques = df[cat_cols].nunique()
+        for col in cat_cols:
             top = df[col].value_counts().head(5)
-            text += f"**{col}** ({nunique} 个唯一值)\n"
+            parts.append(f"**{col}** ({nuniques[col]} 个唯一值)\n")
             for val, cnt in top.items():
-                text += f"  - {val}: {cnt} ({cnt / len(df) * 100:.1f}%)\n"
+                parts.append(f"  - {val}: {cnt} ({cnt * 100 / n:.1f}%)\n")
 
-        return {"success": True, "result": text, "dataframe": df}
+        return {"success": True, "result": "".join(parts), "dataframe": df}
 
-    def _missing_analysis(self, df: pd.DataFrame, table_name: str, total_rows: int) -> Dict[str, Any]:
-        missing = df.isnull().sum()
-        missing_pct = (missing / len(df) * 100).round(2)
+    def _missing_analysis(self, profile: pd.DataFrame, table_name: str) -> Dict[str, Any]:
+        total_rows = int(profile["total"].iloc[0]) if len(profile) else 0
+        missing = profile["null_count"]
+        missing_pct = (missing * 100 / total_rows).round(2)
 
-        text = f"## 缺失值分析: `{table_name}`\n\n"
-        text += "| 字段 | 缺失数 | 缺失率 | 建议 |\n|------|--------|--------|------|\n"
-        for col in df.columns:
+        parts = [
+            f"## 缺失值分析: `{table_name}`\n\n",
+            "| 字段 | 缺失数 | 缺失率 | 建议 |\n|------|--------|--------|------|\n",
+        ]
+        for col in profile.index:
             cnt = missing[col]
             pct = missing_pct[col]
             if pct > 50:
@@ -105,62 +164,105 @@ class DataProfilingTool(BaseTool):
                 advice = "少量缺失可填充"
             else:
                 advice = "完整"
-            text += f"| {col} | {cnt} | {pct}% | {advice} |\n"
+            parts.append(f"| {col} | {cnt} | {pct}% | {advice} |\n")
 
         total_missing = missing.sum()
-        total_cells = len(df) * len(df.columns)
-        text += f"\n整体缺失率: {total_missing}/{total_cells} ({total_missing / total_cells * 100:.2f}%)\n"
-        return {"success": True, "result": text}
-
-    def _distribution_analysis(self, df: pd.DataFrame, table_name: str, column_name: str = None) -> Dict[str, Any]:
-        text = f"## 数据分布分析: `{table_name}`\n\n"
-        cols = [column_name] if column_name and column_name in df.columns else df.select_dtypes(include="number").columns[:5]
-
-        for col in cols:
-            series = pd.to_numeric(df[col], errors="coerce").dropna()
-            if series.empty:
-                continue
-            text += f"### {col}\n"
-            text += f"- 均值: {series.mean():,.2f}\n"
-            text += f"- 中位数: {series.median():,.2f}\n"
-            text += f"- 标准差: {series.std():,.2f}\n"
-            text += f"- 偏度: {series.skew():.2f}\n"
-            text += f"- 峰度: {series.kurtosis():.2f}\n"
-            q1, q3 = series.quantile([0.25, 0.75])
-            iqr = q3 - q1
-            outlier_count = ((series < q1 - 1.5 * iqr) | (series > q3 + 1.5 * iqr)).sum()
-            text += f"- 异常值数量(IQR法): {outlier_count}\n\n"
-
-        return {"success": True, "result": text, "dataframe": df}
-
-    def _outlier_analysis(self, df: pd.DataFrame, table_name: str) -> Dict[str, Any]:
-        text = f"## 异常值分析: `{table_name}`\n\n"
-        numeric = df.select_dtypes(include="number")
-        for col in numeric.columns:
-            series = numeric[col].dropna()
-            if series.empty:
-                continue
-            q1, q3 = series.quantile([0.25, 0.75])
-            iqr = q3 - q1
-            lower = q1 - 1.5 * iqr
-            upper = q3 + 1.5 * iqr
-            outliers = series[(series < lower) | (series > upper)]
-            if len(outliers) > 0:
-                text += f"### {col}\n"
-                text += f"- 正常范围: [{lower:,.2f}, {upper:,.2f}]\n"
-                text += f"- 异常值数量: {len(outliers)} ({len(outliers) / len(series) * 100:.1f}%)\n"
-                text += f"- 异常值范围: [{outliers.min():,.2f}, {outliers.max():,.2f}]\n\n"
-
-        if "无" not in text and "###" not in text:
-            text += "未检测到明显异常值。\n"
-        return {"success": True, "result": text}
-
-    def _unique_analysis(self, df: pd.DataFrame, table_name: str) -> Dict[str, Any]:
-        text = f"## 唯一值分析: `{table_name}`\n\n"
-        text += "| 字段 | 唯一值数 | 唯一率 | 类型 |\n|------|----------|--------|------|\n"
-        for col in df.columns:
-            nunique = df[col].nunique()
-            pct = nunique / len(df) * 100
-            dtype = str(df[col].dtype)
-            text += f"| {col} | {nunique} | {pct:.1f}% | {dtype} |\n"
-        return {"success": True, "result": text}
+        total_cells = total_rows * len(profile)
+        parts.append(f"\n整体缺失率: {total_missing}/{total_cells} ({total_missing / total_cells * 100:.2f}%)\n")
+        return {"success": True, "result": "".join(parts)}
+
+    def _numeric_summary(self, table_name: str, profile_type: str, column_name: Optional[str]) -> Optional[pd.DataFrame]:
+        """Per-column distribution/outlier stats from SQL; ``None`` for large tables or if the DB path fails."""
+        try:
+            row_count = self._metadata_cache.get_or_load(
+                (table_name, "row_count"), lambda: self.db.get_row_count_fast(table_name)
+            )
+            if row_count > SQL_SUMMARY_MAX_ROWS:
+                return None
+            columns = self._metadata_cache.get_or_load(
+                (table_name, "columns"), lambda: self.db.get_column_info(table_name)
+            )
+            if profile_type == "distribution" and column_name in {c["name"] for c in columns}:
+                cols = [column_name]
+            else:
+                cols = self._metadata_cache.get_or_load(
+                    (table_name, "numeric_columns"), lambda: self.db.get_numeric_columns(table_name)
+                )
+                if profile_type == "distribution":
+                    cols = cols[:5]
+            return self._metadata_cache.get_or_load(
+                (table_name, "numeric_summary", tuple(cols)),
+                lambda: self.db.numeric_summary(table_name, cols),
+            )
+        except Exception as e:
+            logger.warning("SQL numeric summary failed for %s, using a sample instead: %s", table_name, e)
+            return None
+
+    @staticmethod
+    def _sample_summary(df: pd.DataFrame, cols) -> pd.DataFrame:
+        """Same statistics as ``DatabaseManager.numeric_summary``, computed on a sample."""
+        numeric = df[list(cols)].apply(pd.to_numeric, errors="coerce")
+        q1 = numeric.quantile(0.25)
+        q3 = numeric.quantile(0.75)
+        iqr = q3 - q1
+        lower = q1 - 1.5 * iqr
+        upper = q3 + 1.5 * iqr
+        mask = numeric.lt(lower, axis=1) | numeric.gt(upper, axis=1)
+        outliers = numeric.where(mask)
+        return pd.DataFrame({
+            "count": numeric.count(),
+            "mean": numeric.mean(),
+            "std": numeric.std(),
+            "skew": numeric.skew(),
+            "kurt": numeric.kurt(),
+            "q1": q1,
+            "median": numeric.median(),
+            "q3": q3,
+            "lower": lower,
+            "upper": upper,
+            "outliers": mask.sum(),
+            "outlier_min": outliers.min(),
+            "outlier_max": outliers.max(),
+        })
+
+    def _distribution_analysis(self, summary: pd.DataFrame, table_name: str) -> Dict[str, Any]:
+        parts = [f"## 数据分布分析: `{table_name}`\n\n"]
+        for col, st in summary[summary["count"] > 0].iterrows():
+            parts.append(
+                f"### {col}\n"
+                f"- 均值: {st['mean']:,.2f}\n"
+                f"- 中位数: {st['median']:,.2f}\n"
+                f"- 标准差: {st['std']:,.2f}\n"
+                f"- 偏度: {st['skew']:.2f}\n"
+                f"- 峰度: {st['kurt']:.2f}\n"
+                f"- 异常值数量(IQR法): {int(st['outliers'])}\n\n"
+            )
+        return {"success": True, "result": "".join(parts), "dataframe": summary}
+
+    def _outlier_analysis(self, summary: pd.DataFrame, table_name: str) -> Dict[str, Any]:
+        parts = [f"## 异常值分析: `{table_name}`\n\n"]
+        for col, st in summary[summary["outliers"] > 0].iterrows():
+            parts.append(
+                f"### {col}\n"
+                f"- 正常范围: [{st['lower']:,.2f}, {st['upper']:,.2f}]\n"
+                f"- 异常值数量: {int(st['outliers'])} ({st['outliers'] / st['count'] * 100:.1f}%)\n"
+                f"- 异常值范围: [{st['outlier_min']:,.2f}, {st['outlier_max']:,.2f}]\n\n"
+            )
+
+        if not (summary["outliers"] > 0).any():
+            parts.append("未检测到明显异常值。\n")
+        return {"success": True, "result": "".join(parts)}
+
+    def _unique_analysis(
+        self, profile: pd.DataFrame, columns: List[Dict[str, Any]], table_name: str
+    ) -> Dict[str, Any]:
+        parts = [
+            f"## 唯一值分析: `{table_name}`\n\n",
+            "| 字段 | 唯一值数 | 唯一率 | 类型 |\n|------|----------|--------|------|\n",
+        ]
+        nuniques = profile["nunique"]
+        pcts = nuniques * 100 / profile["total"]
+        parts.extend(
+            f"| {c['name']} | {nuniques[c['name']]} | {pcts[c['name']]:.1f}% | {c['type']} |\n" for c in columns
+        )
+        return {"success": True, "result": "".join(parts)}
@@ -1,21 +1,22 @@
 import ast
+import hashlib
 import io
 import os
+import queue
 import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from types import SimpleNamespace
 from typing import Any, Dict, List, Optional
 
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-from matplotlib import font_manager
-import numpy as np
 import pandas as pd
-import seaborn as sns
 
 from core.database import DatabaseManager
 from core.llm_client import LLMClient
-from tools.base_tool import BaseTool
+from tools.base_tool import BaseTool, extract_sql
+from utils.cache import TTLCache
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -23,6 +24,27 @@ logger = get_logger(__name__)
 _IMG_DIR = "viz_images"
 os.makedirs(_IMG_DIR, exist_ok=True)
 
+VIZ_SQL_CACHE_TTL = 600
+SCHEMA_PROMPT_TTL = 300
+
+_FONT_RE = re.compile(r"simhei|noto|wqy|wenquanyi|microsoftyahei", re.IGNORECASE)
+# Dates and month buckets such as strftime('%Y-%m') output ("2024-10").
+_DATE_LIKE_RE = re.compile(r"^\d{4}[-/]\d{1,2}(?:[-/]\d{1,2})?")
+# Checked in order: the first chart type with any keyword in the question wins.
+# One pattern per type rather than a single alternation, which would pick
+# whichever keyword appears earliest in the text instead.
+_CHART_KEYWORDS = [
+    (ctype, re.compile("|".join(keywords), re.IGNORECASE))
+    for ctype, keywords in (
+        ("pie", ["饼图", "占比", "比例", "构成", "pie"]),
+        ("scatter", ["散点", "相关性", "scatter", "关系"]),
+        ("histogram", ["直方图", "分布", "频率", "histogram"]),
+        ("heatmap", ["热力图", "heatmap", "相关矩阵"]),
+        ("line", ["趋势", "变化", "走势", "trend", "折线", "line"]),
+        ("bar", ["柱状", "对比", "排名", "bar", "top"]),
+    )
+]
+
 
 class DataVisualizationTool(BaseTool):
     """Create data visualisations: line, bar, pie, scatter, histogram, heatmap."""
@@ -37,25 +59,44 @@ class DataVisualizationTool(BaseTool):
         '"sql": "(可选)直接提供SQL", "title": "(可选)图表标题"}'
     )
 
+    # Font discovery walks the filesystem, so it is done once per process.
+    # None means "not looked yet"; "" means no CJK font was found.
+    _font_path_cached: Optional[str] = None
+
     def __init__(self, db: DatabaseManager, llm: LLMClient):
         self.db = db
         self.llm = llm
-        self._setup_fonts()
+        self._sql_cache = TTLCache(ttl=VIZ_SQL_CACHE_TTL)
+        self._schema_prompt: Optional[str] = None
+        self._schema_ts = 0.0
 
-    def _setup_fonts(self):
+    @classmethod
+    def _setup_fonts(cls):
+        if cls._font_path_cached is not None:
+            return
         try:
-            font_paths = font_manager.findSystemFonts()
-            chinese_fonts = [
-                f for f in font_paths
-                if any(n in f.lower() for n in ["simhei", "noto", "wqy", "wenquanyi", "microsoftyahei"])
-            ]
-            if chinese_fonts:
-                self._font_prop = font_manager.FontProperties(fname=chinese_fonts[0])
-            else:
-                self._font_prop = font_manager.FontProperties(family="sans-serif")
+            font_manager = _lazy_mpl().font_manager
+            font_path = next((f for f in font_manager.findSystemFonts() if _FONT_RE.search(f)), None)
         except Exception:
-            self._font_prop = font_manager.FontProperties(family="sans-serif")
-        plt.rcParams["axes.unicode_minus"] = False
+            font_path = None
+        cls._font_path_cached = font_path or ""
+        _init_mpl(cls._font_path_cached)
+
+    @property
+    def schema_prompt(self) -> str:
+        """Compact ``table(col:type, ...)`` schema for the SQL prompt, rebuilt every few minutes."""
+        if self._schema_prompt is None or time.monotonic() - self._schema_ts > SCHEMA_PROMPT_TTL:
+            self._schema_prompt = "; ".join(
+                f"{table}({', '.join(c['name'] + ':' + c['type'] for c in columns)})"
+                for table, columns in self.db.get_all_columns().items()
+            )
+            self._schema_ts = time.monotonic()
+        return self._schema_prompt
+
+    def invalidate_schema(self):
+        """Drop the cached schema prompt and any SQL generated against it; call after DDL."""
+        self._schema_prompt = None
+        self._sql_cache.invalidate()
 
     def execute(self, **kwargs) -> Dict[str, Any]:
         question = kwargs.get("question", "")
@@ -99,51 +140,53 @@ class DataVisualizationTool(BaseTool):
     # SQL generation for visualisation
     # ------------------------------------------------------------------
     def _generate_viz_sql(self, question: str) -> Optional[str]:
-        schema = self.db.get_table_info()
-        prompt = f"""你是一位SQL专家。请为以下可视化需求生成SQL查询。
-
-数据库表结构:
-{schema}
+        schema = self.schema_prompt
+        key = (question, hashlib.sha1(schema.encode()).hexdigest()[:16])
+        sql = self._sql_cache.get_or_load(key, lambda: self._request_viz_sql(question, schema))
+        if sql is None:
+            # Don't pin a failed generation; the next request should retry.
+            self._sql_cache.invalidate(lambda k: k == key)
+        return sql
 
-可视化需求: {question}
+    def _request_viz_sql(self, question: str, schema: str) -> Optional[str]:
+        # Static instructions and schema first, so providers can reuse the cached prefix.
+        system = f"""你是一位SQL专家。请为用户的可视化需求生成SQL查询。
 
 要求:
 1. SQL结果的第一列应为X轴（通常是时间或分类字段）
 2. 其余列为Y轴数值
 3. 按X轴排序
 4. 只返回SQL语句，不要其他内容
-5. 使用聚合函数时注意GROUP BY"""
+5. 使用聚合函数时注意GROUP BY
+
+数据库表结构:
+{schema}"""
 
-        response = self.llm.chat([{"role": "user", "content": prompt}])
-        sql = self._extract_sql(response)
+        response = self.llm.chat([
+            {"role": "system", "content": system},
+            {"role": "user", "content": f"可视化需求: {question}"},
+        ])
+        sql = extract_sql(response)
         logger.info("Generated viz SQL: %s", sql)
         return sql
 
-    @staticmethod
-    def _extract_sql(text: str) -> Optional[str]:
-        text = text.strip()
-        if "```sql" in text:
-            text = text.split("```sql", 1)[1].split("```")[0].strip()
-        elif "```" in text:
-            text = text.split("```", 1)[1].split("```")[0].strip()
-        if "SELECT" in text.upper():
-            idx = text.upper().find("SELECT")
-            return text[idx:].rstrip(";").strip()
-        return None
-
     def _execute_sql_to_df(self, sql: str) -> Optional[pd.DataFrame]:
         try:
             df = self.db.execute_sql_df(sql)
-            for col in df.columns:
+            # Columns the driver already typed are left alone; only text is probed.
+            for col in df.select_dtypes(include=["object", "string"]).columns:
                 try:
-                    df[col] = pd.to_numeric(df[col], errors="ignore")
-                except Exception:
+                    df[col] = pd.to_numeric(df[col])
+                    continue
+                except (ValueError, TypeError):
                     pass
+                sample = df[col].dropna().head(20).astype(str)
+                if sample.empty or not sample.str.match(_DATE_LIKE_RE).mean() > 0.5:
+                    continue
                 try:
-                    if df[col].dtype == object:
-                        test = pd.to_datetime(df[col], errors="coerce")
-                        if test.notna().sum() > len(df) * 0.5:
-                            df[col] = test
+                    test = pd.to_datetime(df[col], errors="coerce")
+                    if test.notna().sum() > len(df) * 0.5:
+                        df[col] = test
                 except Exception:
                     pass
             return df
@@ -155,19 +198,9 @@ class DataVisualizationTool(BaseTool):
     # Chart type inference
     # ------------------------------------------------------------------
     def _infer_chart_type(self, df: pd.DataFrame, question: str) -> str:
-        q = question.lower()
-        keyword_map = {
-            "pie": ["饼图", "占比", "比例", "构成", "pie"],
-            "scatter": ["散点", "相关性", "scatter", "关系"],
-            "histogram": ["直方图", "分布", "频率", "histogram"],
-            "heatmap": ["热力图", "heatmap", "相关矩阵"],
-            "line": ["趋势", "变化", "走势", "trend", "折线", "line"],
-            "bar": ["柱状", "对比", "排名", "bar", "top"],
-        }
-        for ctype, keywords in keyword_map.items():
-            for kw in keywords:
-                if kw in q:
-                    return ctype
+        for ctype, pattern in _CHART_KEYWORDS:
+            if pattern.search(question):
+                return ctype
 
         x_col = df.columns[0]
         if pd.api.types.is_datetime64_any_dtype(df[x_col]):
@@ -180,99 +213,199 @@ class DataVisualizationTool(BaseTool):
     # Chart creation
     # ------------------------------------------------------------------
     def _create_chart(self, df: pd.DataFrame, chart_type: str, title: str) -> Optional[str]:
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(_IMG_DIR, f"viz_{chart_type}_{ts}_{uuid.uuid4().hex[:6]}.png")
         try:
-            fig, ax = plt.subplots(figsize=(12, 6))
-            sns.set_style("whitegrid")
-
-            method = getattr(self, f"_draw_{chart_type}", None)
-            if method is None:
-                method = self._draw_bar
-            method(df, ax, title)
-
-            plt.tight_layout()
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            path = os.path.join(_IMG_DIR, f"viz_{chart_type}_{ts}.png")
-            fig.savefig(path, dpi=150, bbox_inches="tight")
-            plt.close(fig)
+            path = _CHART_POOL.submit(self._draw, df, chart_type, title, path).result()
             logger.info("Chart saved: %s", path)
             return path
         except Exception as e:
             logger.error("Chart creation failed: %s", e, exc_info=True)
-            plt.close("all")
             return None
 
+    def _draw(self, df: pd.DataFrame, chart_type: str, title: str, path: str) -> str:
+        # Runs on the chart thread, the only thread that touches matplotlib's
+        # global state (rcParams via _init_mpl/sns.set_style, and drawing).
+        self._setup_fonts()
+        return _render_chart(df, chart_type, title, path)
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    def _summarise_data(self, df: pd.DataFrame) -> str:
+        parts = [f"数据包含 {len(df)} 行, {len(df.columns)} 列。"]
+        num_cols = [c for c, t in df.dtypes.items() if pd.api.types.is_numeric_dtype(t)]
+        date_cols = [c for c, t in df.dtypes.items() if pd.api.types.is_datetime64_any_dtype(t)]
+        num_stats = df[num_cols].agg(["sum", "mean", "max", "min"]) if num_cols else None
+        date_stats = df[date_cols].agg(["min", "max"]) if date_cols else None
+        for col in df.columns:
+            if col in num_cols:
+                parts.append(
+                    f"- {col}: 总和={num_stats.at['sum', col]:,.2f}, "
+                    f"均值={num_stats.at['mean', col]:,.2f}, "
+                    f"最大={num_stats.at['max', col]:,.2f}, 最小={num_stats.at['min', col]:,.2f}"
+                )
+            elif col in date_cols:
+                parts.append(f"- {col}: 范围 {date_stats.at['min', col]} ~ {date_stats.at['max', col]}")
+        return "\n".join(parts)
+
+    @staticmethod
+    def _chart_type_cn(chart_type: str) -> str:
+        mapping = {
+            "line": "折线图",
+            "bar": "柱状图",
+            "pie": "饼图",
+            "scatter": "散点图",
+            "histogram": "直方图",
+            "heatmap": "热力图",
+        }
+        return mapping.get(chart_type, "图表")
+
+    @staticmethod
+    def _generate_title(question: str, chart_type: str) -> str:
+        if question:
+            return question[:50]
+        return f"数据{DataVisualizationTool._chart_type_cn(chart_type)}"
+
+
+# ----------------------------------------------------------------------
+# Rendering
+#
+# Charts are drawn with the object-oriented Figure API (a Figure on its own
+# FigureCanvasAgg, no pyplot state) on one dedicated render thread, so
+# concurrent visualisation steps never draw into matplotlib at the same time.
+# ----------------------------------------------------------------------
+_CHART_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chart-render")
+# Figures are reused between renders instead of rebuilt.
+_FIG_POOL: queue.LifoQueue = queue.LifoQueue(maxsize=4)
+_mpl: Optional[SimpleNamespace] = None
+
+
+def _lazy_mpl() -> SimpleNamespace:
+    """Import matplotlib/seaborn on first use so the tool loads without them."""
+    global _mpl
+    if _mpl is None:
+        import matplotlib
+        matplotlib.use("Agg")
+        from matplotlib import font_manager
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        import seaborn as sns
+
+        _mpl = SimpleNamespace(
+            matplotlib=matplotlib,
+            font_manager=font_manager,
+            Figure=Figure,
+            FigureCanvasAgg=FigureCanvasAgg,
+            sns=sns,
+        )
+    return _mpl
+
+
+def _init_mpl(font_path: str = ""):
+    """Configure matplotlib for this process; the CJK font goes into rcParams once."""
+    mpl = _lazy_mpl()
+    font_manager = mpl.font_manager
+    mpl.sns.set_style("whitegrid")  # resets the font rcParams, so it must come first
+    rc = mpl.matplotlib.rcParams
+    rc["axes.unicode_minus"] = False
+    if font_path:
+        font_manager.fontManager.addfont(font_path)
+        name = font_manager.FontProperties(fname=font_path).get_name()
+        rc["font.family"] = "sans-serif"
+        rc["font.sans-serif"] = [name] + [f for f in rc["font.sans-serif"] if f != name]
+
+
+def _render_chart(df: pd.DataFrame, chart_type: str, title: str, path: str) -> str:
+    try:
+        fig = _FIG_POOL.get_nowait()
+    except queue.Empty:
+        mpl = _lazy_mpl()
+        fig = mpl.Figure(figsize=(12, 6))
+        mpl.FigureCanvasAgg(fig)
+    try:
+        # Heatmaps add a colorbar axes, so the whole figure is cleared, not just ax.
+        fig.clear()
+        ax = fig.add_subplot(111)
+        _RENDERER.draw(df, chart_type, ax, title)
+        fig.tight_layout()
+        fig.savefig(path, dpi=150, bbox_inches="tight")
+        return path
+    finally:
+        fig.clear()
+        try:
+            _FIG_POOL.put_nowait(fig)
+        except queue.Full:
+            pass
+
+
+class _ChartRenderer:
+    """Draws one chart type onto an existing axes."""
+
+    def draw(self, df: pd.DataFrame, chart_type: str, ax, title: str):
+        method = getattr(self, f"_draw_{chart_type}", None)
+        if method is None:
+            method = self._draw_bar
+        method(df, ax, title)
+
     def _draw_line(self, df: pd.DataFrame, ax, title: str):
         x = df.columns[0]
-        for col in df.columns[1:]:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                ax.plot(df[x], df[col], marker="o", label=col)
-        ax.set_xlabel(x, fontproperties=self._font_prop)
-        ax.set_ylabel("数值", fontproperties=self._font_prop)
-        ax.set_title(title, fontproperties=self._font_prop, fontsize=14)
+        numeric_cols = [c for c in df.columns[1:] if pd.api.types.is_numeric_dtype(df[c])]
+        if numeric_cols:
+            df.set_index(x)[numeric_cols].plot.line(ax=ax, marker="o", legend=False)
+        ax.set_xlabel(x)
+        ax.set_ylabel("数值")
+        ax.set_title(title, fontsize=14)
         ax.tick_params(axis="x", rotation=45)
-        for label in ax.get_xticklabels():
-            label.set_fontproperties(self._font_prop)
-        for label in ax.get_yticklabels():
-            label.set_fontproperties(self._font_prop)
         if len(df.columns) > 2:
-            ax.legend(prop=self._font_prop)
+            ax.legend()
 
     def _draw_bar(self, df: pd.DataFrame, ax, title: str):
         x = df.columns[0]
         numeric_cols = [c for c in df.columns[1:] if pd.api.types.is_numeric_dtype(df[c])]
         if not numeric_cols:
             numeric_cols = [df.columns[1]]
-            df[numeric_cols[0]] = pd.to_numeric(df[numeric_cols[0]], errors="coerce")
 
         x_vals = df[x].astype(str)
-        width = 0.8 / max(len(numeric_cols), 1)
-        positions = np.arange(len(x_vals))
-
-        for i, col in enumerate(numeric_cols):
-            offset = (i - len(numeric_cols) / 2 + 0.5) * width
-            ax.bar(positions + offset, df[col], width=width, label=col)
-
-        ax.set_xticks(positions)
-        ax.set_xticklabels(x_vals, rotation=45, ha="right", fontproperties=self._font_prop)
-        ax.set_xlabel(x, fontproperties=self._font_prop)
-        ax.set_ylabel("数值", fontproperties=self._font_prop)
-        ax.set_title(title, fontproperties=self._font_prop, fontsize=14)
-        for label in ax.get_yticklabels():
-            label.set_fontproperties(self._font_prop)
+        plot_df = df[numeric_cols].apply(pd.to_numeric, errors="coerce").set_index(x_vals)
+        plot_df.plot.bar(ax=ax, width=0.8, legend=False)
+
+        ax.set_xticklabels(x_vals, rotation=45, ha="right")
+        ax.set_xlabel(x)
+        ax.set_ylabel("数值")
+        ax.set_title(title, fontsize=14)
         if len(numeric_cols) > 1:
-            ax.legend(prop=self._font_prop)
+            ax.legend()
 
     def _draw_pie(self, df: pd.DataFrame, ax, title: str):
         label_col = df.columns[0]
         value_col = df.columns[1] if len(df.columns) > 1 else df.columns[0]
         values = pd.to_numeric(df[value_col], errors="coerce").fillna(0)
         labels = df[label_col].astype(str)
-        wedges, texts, autotexts = ax.pie(
+        ax.pie(
             values,
             labels=labels,
             autopct="%1.1f%%",
             startangle=90,
         )
-        for t in texts:
-            t.set_fontproperties(self._font_prop)
-        ax.set_title(title, fontproperties=self._font_prop, fontsize=14)
+        ax.set_title(title, fontsize=14)
 
     def _draw_scatter(self, df: pd.DataFrame, ax, title: str):
         x = df.columns[0]
         y = df.columns[1] if len(df.columns) > 1 else df.columns[0]
         ax.scatter(pd.to_numeric(df[x], errors="coerce"), pd.to_numeric(df[y], errors="coerce"), alpha=0.6)
-        ax.set_xlabel(x, fontproperties=self._font_prop)
-        ax.set_ylabel(y, fontproperties=self._font_prop)
-        ax.set_title(title, fontproperties=self._font_prop, fontsize=14)
+        ax.set_xlabel(x)
+        ax.set_ylabel(y)
+        ax.set_title(title, fontsize=14)
 
     def _draw_histogram(self, df: pd.DataFrame, ax, title: str):
         numeric_cols = df.select_dtypes(include="number").columns
         col = numeric_cols[0] if len(numeric_cols) > 0 else df.columns[0]
         data = pd.to_numeric(df[col], errors="coerce").dropna()
         ax.hist(data, bins=min(30, max(10, len(data) // 5)), edgecolor="white", alpha=0.7)
-        ax.set_xlabel(col, fontproperties=self._font_prop)
-        ax.set_ylabel("频次", fontproperties=self._font_prop)
-        ax.set_title(title, fontproperties=self._font_prop, fontsize=14)
+        ax.set_xlabel(col)
+        ax.set_ylabel("频次")
+        ax.set_title(title, fontsize=14)
 
     def _draw_heatmap(self, df: pd.DataFrame, ax, title: str):
         numeric_df = df.select_dtypes(include="number")
@@ -280,39 +413,8 @@ class DataVisualizationTool(BaseTool):
             self._draw_bar(df, ax, title)
             return
         corr = numeric_df.corr()
-        sns.heatmap(corr, annot=True, fmt=".2f", cmap="coolwarm", ax=ax)
-        ax.set_title(title, fontproperties=self._font_prop, fontsize=14)
+        _lazy_mpl().sns.heatmap(corr, annot=True, fmt=".2f", cmap="coolwarm", ax=ax)
+        ax.set_title(title, fontsize=14)
 
-    # ------------------------------------------------------------------
-    # Helpers
-    # ------------------------------------------------------------------
-    def _summarise_data(self, df: pd.DataFrame) -> str:
-        parts = [f"数据包含 {len(df)} 行, {len(df.columns)} 列。"]
-        for col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                parts.append(
-                    f"- {col}: 总和={df[col].sum():,.2f}, "
-                    f"均值={df[col].mean():,.2f}, "
-                    f"最大={df[col].max():,.2f}, 最小={df[col].min():,.2f}"
-                )
-            elif pd.api.types.is_datetime64_any_dtype(df[col]):
-                parts.append(f"- {col}: 范围 {df[col].min()} ~ {df[col].max()}")
-        return "\n".join(parts)
 
-    @staticmethod
-    def _chart_type_cn(chart_type: str) -> str:
-        mapping = {
-            "line": "折线图",
-            "bar": "柱状图",
-            "pie": "饼图",
-            "scatter": "散点图",
-            "histogram": "直方图",
-            "heatmap": "热力图",
-        }
-        return mapping.get(chart_type, "图表")
-
-    @staticmethod
-    def _generate_title(question: str, chart_type: str) -> str:
-        if question:
-            return question[:50]
-        return f"数据{DataVisualizationTool._chart_type_cn(chart_type)}"
+_RENDERER = _ChartRenderer()
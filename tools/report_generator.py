@@ -1,6 +1,11 @@
+import atexit
 import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime
-from typing import Any, Dict, List
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
 
 from core.llm_client import LLMClient
 from tools.base_tool import BaseTool
@@ -11,6 +16,11 @@ logger = get_logger(__name__)
 _REPORT_DIR = "reports"
 os.makedirs(_REPORT_DIR, exist_ok=True)
 
+# Reports are written by a single background thread so execute() does not block on disk.
+_WRITER_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-writer")
+_pending_writes: Set[Future] = set()
+_pending_lock = threading.Lock()
+
 
 class ReportGeneratorTool(BaseTool):
     """Generate structured analysis reports from tool results."""
@@ -25,11 +35,17 @@ class ReportGeneratorTool(BaseTool):
         '"analysis_results": "之前各步骤的分析结果", '
         '"report_type": "summary/detailed/executive"}'
     )
+    idempotent = False
 
     def __init__(self, llm: LLMClient):
         self.llm = llm
 
     def execute(self, **kwargs) -> Dict[str, Any]:
+        """Generate the report and queue it for writing.
+
+        ``data["report_path"]`` names the file the report is being written
+        to; it may not exist yet, so call ``flush()`` before reading it.
+        """
         question = kwargs.get("question", "")
         analysis_results = kwargs.get("analysis_results", "")
         report_type = kwargs.get("report_type", "summary")
@@ -43,6 +59,7 @@ class ReportGeneratorTool(BaseTool):
         return {
             "success": True,
             "result": report,
+            # report_path may not exist until the background write finishes; see flush().
             "data": {"report_path": path, "report_type": report_type},
         }
 
@@ -75,9 +92,35 @@ class ReportGeneratorTool(BaseTool):
 
     @staticmethod
     def _save_report(report: str, report_type: str) -> str:
+        """Queue the report for writing and return its path straight away."""
+        # Same-second reports must not overwrite each other.
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        path = os.path.join(_REPORT_DIR, f"report_{report_type}_{ts}.md")
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(report)
-        logger.info("Report saved: %s", path)
+        path = os.path.join(_REPORT_DIR, f"report_{report_type}_{ts}_{uuid.uuid4().hex[:8]}.md")
+        future = _WRITER_POOL.submit(_write_report, path, report)
+        with _pending_lock:
+            _pending_writes.add(future)
+        future.add_done_callback(_forget_write)
         return path
+
+    @classmethod
+    def flush(cls, timeout: Optional[float] = None):
+        """Block until every queued report has been written."""
+        with _pending_lock:
+            pending = list(_pending_writes)
+        wait(pending, timeout=timeout)
+
+
+def _write_report(path: str, report: str):
+    Path(path).write_bytes(report.encode("utf-8"))
+    logger.info("Report saved: %s", path)
+
+
+def _forget_write(future: Future):
+    with _pending_lock:
+        _pending_writes.discard(future)
+    if future.exception() is not None:
+        logger.error("Report write failed: %s", future.exception())
+
+
+# Queued reports must reach disk even if the process exits right after execute().
+atexit.register(ReportGeneratorTool.flush)
@@ -1,19 +1,49 @@
-import re
-from typing import Any, Dict, List, Optional
+import ast
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-from langchain_classic.chains import create_sql_query_chain
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import PydanticOutputParser, StrOutputParser
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from pydantic import BaseModel, Field
 
 from core.database import DatabaseManager
+from core.embeddings import EmbeddingIndex, embed, literal_signature
+from core.embeddings import warm_up as warm_up_encoder
 from core.llm_client import LLMClient
-from tools.base_tool import BaseTool
+from tools.base_tool import BaseTool, extract_sql
+from utils.cache import CACHE_DIR, SQLiteCache
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+_CACHE_PATH = os.path.join(CACHE_DIR, "sql_query.db")
+SQL_CACHE_TTL = 3600
+
+SEMANTIC_CACHE_SIZE = 512
+SEMANTIC_CACHE_THRESHOLD = 0.92
+# Multilingual, since questions are mostly Chinese.
+_SQL_EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+
+# Row limit suggested to the LLM when the question does not give one.
+SQL_TOP_K = 5
+
+
+class _SQLPlan(BaseModel):
+    """SQL for a question plus, for single-value answers, a template to phrase it."""
+
+    sql: str = Field(description="可直接在 SQLite 上执行的单条 SELECT 语句")
+    answer_template: Optional[str] = Field(
+        default=None,
+        description="查询结果只有一个值时的中文回答，用 {result} 代表该值；否则为 null",
+    )
+
 
 class SQLQueryTool(BaseTool):
     """Convert natural-language questions to SQL, execute, and return results."""
@@ -29,61 +59,124 @@ class SQLQueryTool(BaseTool):
         self.db = db
         self.llm = llm
         self.chain = self._build_chain()
+        self._cache = SQLiteCache(_CACHE_PATH, table="sql_cache")
+        # normalised question -> (schema version, context hash, literal signature, sql)
+        self._semantic: "OrderedDict[str, Tuple[int, str, Tuple[str, ...], str]]" = OrderedDict()
+        self._semantic_index = EmbeddingIndex(SEMANTIC_CACHE_SIZE)
+        self._semantic_lock = threading.Lock()
+        warm_up_encoder(_SQL_EMBEDDING_MODEL)
+
+    @staticmethod
+    def _normalise(question: str) -> str:
+        return " ".join(question.lower().split())
+
+    @staticmethod
+    def _context_hash(context: str) -> str:
+        return hashlib.sha1(context.encode("utf-8")).hexdigest()
+
+    def _semantic_lookup(
+        self, question: str, vec: Optional[np.ndarray], schema_version: int, context: str
+    ) -> Optional[str]:
+        """SQL of a previously answered, near-identical question under the same schema and context.
+
+        The questions must also share their numbers and quoted literals, since
+        "2023年销售额" and "2024年销售额" embed almost identically.
+        """
+        if vec is None:
+            return None
+        with self._semantic_lock:
+            match = self._semantic_index.search(vec)
+            if match is None or match[1] < SEMANTIC_CACHE_THRESHOLD:
+                return None
+            entry = self._semantic[match[0]]
+            if (
+                entry[0] != schema_version
+                or entry[1] != self._context_hash(context)
+                or entry[2] != literal_signature(question)
+            ):
+                return None
+            self._semantic.move_to_end(match[0])
+        logger.info("SQL semantic cache hit (%.3f): %s", match[1], match[0])
+        return entry[3]
+
+    def _semantic_store(self, question: str, vec: Optional[np.ndarray], schema_version: int, context: str, sql: str):
+        if vec is None:
+            return
+        key = self._normalise(question)
+        with self._semantic_lock:
+            self._semantic.pop(key, None)
+            while len(self._semantic) >= SEMANTIC_CACHE_SIZE:
+                old_key, _ = self._semantic.popitem(last=False)
+                self._semantic_index.remove(old_key)
+            self._semantic_index.add(key, vec)
+            self._semantic[key] = (schema_version, self._context_hash(context), literal_signature(question), sql)
+
+    def _cache_key(self, question: str, context: str) -> str:
+        raw = f"{question}|{context}|{self.db.schema_version()}"
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _is_error(raw: str) -> bool:
+        return raw.lstrip().startswith("Error")
 
     def _clean_sql_response(self, response: str) -> str:
-        if "SQLQuery:" in response:
-            cleaned = response.split("SQLQuery:", 1)[1].strip()
-        elif "SELECT" in response.upper():
-            start_idx = response.upper().find("SELECT")
-            cleaned = response[start_idx:].strip()
-            if "```" in cleaned:
-                cleaned = cleaned.split("```")[0].strip()
-        else:
+        _, prefix, rest = response.partition("SQLQuery:")
+        body = rest if prefix else response
+        cleaned = extract_sql(body)
+        if cleaned is None:
             logger.warning("Cannot extract SQL from response: %s", response[:200])
-            cleaned = response
-        cleaned = cleaned.rstrip(";").strip() + ""
+            cleaned = body.strip().rstrip(";").strip()
         logger.debug("Cleaned SQL: %s", cleaned)
         return cleaned
 
     def _build_chain(self):
-        write_query = create_sql_query_chain(self.llm, self.db.langchain_db)
+        self._plan_parser = PydanticOutputParser(pydantic_object=_SQLPlan)
+        plan_prompt = PromptTemplate.from_template(
+            """你是一名 SQLite 专家。根据数据库结构和对话历史，为当前问题编写 SQL 查询，并给出回答模板。
+
+要求：
+1. 只写一条 SELECT 语句；除非问题指定了数量，最多返回 {top_k} 行，只查询回答问题需要的列。
+2. 只使用下面数据库结构中出现的表和列。
+3. 如果查询结果只会有一个值，answer_template 写一句完整的中文回答，用 {{result}} 代表该值；否则 answer_template 为 null。
+
+{format_instructions}
+
+数据库结构：
+{table_info}
+
+对话历史：
+{context}
+
+当前问题：{question}""",
+            partial_variables={"format_instructions": self._plan_parser.get_format_instructions()},
+        )
         answer_prompt = PromptTemplate.from_template(
-            """基于以下信息回答问题：
+            """基于以下信息回答问题。
+请用自然语言给出简洁、专业的答案。如果结果中的数值为 0，明确说明"没有记录"。
+用中文回答，格式清晰。
 
 对话历史：
 {context}
 
 当前问题：{question}
 生成的 SQL 查询：{clean_query}
-数据库返回结果：{result}
-
-请用自然语言给出简洁、专业的答案。如果结果中的数值为 0，明确说明"没有记录"。
-用中文回答，格式清晰。"""
+数据库返回结果：{result}"""
         )
+        # Both prompts keep their fixed text first and per-question fields last,
+        # so providers can reuse the cached prompt prefix.
+        # One LLM call writes the SQL and, when it can, the answer wording too.
+        self.plan_chain = plan_prompt | self.llm | StrOutputParser()
+        # Answer synthesis alone, for when the SQL is already known.
+        self.answer_chain = answer_prompt | self.llm | StrOutputParser()
         chain = (
             RunnablePassthrough.assign(
                 question=lambda x: x["question"],
                 context=lambda x: x.get("context", "无"),
             )
-            .assign(
-                clean_query=write_query | RunnableLambda(self._clean_sql_response)
-            )
-            .assign(
-                result=lambda x: self.db.execute_sql(x["clean_query"])
-            )
-            .assign(
-                response=(
-                    {
-                        "question": lambda x: x["question"],
-                        "context": lambda x: x["context"],
-                        "clean_query": lambda x: x["clean_query"],
-                        "result": lambda x: x["result"],
-                    }
-                    | answer_prompt
-                    | self.llm
-                    | StrOutputParser()
-                )
-            )
+            .assign(plan=RunnableLambda(self._plan))
+            .assign(clean_query=lambda x: x["plan"].sql)
+            .assign(result=lambda x: self.db.execute_sql(x["clean_query"]))
+            .assign(response=RunnableLambda(self._answer))
             | {
                 "response": lambda x: x["response"],
                 "clean_query": lambda x: x["clean_query"],
@@ -92,6 +185,65 @@ class SQLQueryTool(BaseTool):
         )
         return chain
 
+    def _plan(self, x: Dict[str, Any]) -> _SQLPlan:
+        text = self.plan_chain.invoke({
+            "table_info": self.db.get_table_info(),
+            "context": x["context"],
+            "question": x["question"],
+            "top_k": SQL_TOP_K,
+        })
+        try:
+            plan = self._plan_parser.parse(text)
+        except OutputParserException:
+            logger.warning("SQL plan was not valid JSON, extracting SQL only")
+            return _SQLPlan(sql=self._clean_sql_response(text))
+        plan.sql = self._clean_sql_response(plan.sql)
+        return plan
+
+    def _answer(self, x: Dict[str, Any]) -> str:
+        return self._synthesise(
+            x["question"], x["context"], x["clean_query"], x["result"], x["plan"].answer_template
+        )
+
+    def _synthesise(self, question: str, context: str, sql: str, raw: str, template: Optional[str] = None) -> str:
+        """Phrase the answer; empty and single-value results never reach the LLM."""
+        trivial, value = self._scalar_result(raw)
+        if not trivial:
+            return self.answer_chain.invoke(
+                {"question": question, "context": context, "clean_query": sql, "result": raw}
+            )
+        logger.info("Answered trivial SQL result without the LLM")
+        if not value:
+            return "没有记录"
+        return self._render_answer(template, value) or f"查询结果：{value}"
+
+    @staticmethod
+    def _scalar_result(raw: str) -> Tuple[bool, Any]:
+        """``(True, value)`` for an empty or single-value result (value ``None`` when empty)."""
+        if not raw.strip():
+            return True, None
+        try:
+            rows = ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            return False, None
+        if not isinstance(rows, list) or len(rows) > 1:
+            return False, None
+        if not rows:
+            return True, None
+        if isinstance(rows[0], tuple) and len(rows[0]) == 1:
+            return True, rows[0][0]
+        return False, None
+
+    @staticmethod
+    def _render_answer(template: Optional[str], value: Any) -> Optional[str]:
+        """Fill the plan's answer template with ``value``, or ``None`` if it cannot be used."""
+        if not template or "{result" not in template:
+            return None
+        try:
+            return template.format_map({"result": value})
+        except (KeyError, ValueError, IndexError):
+            return None
+
     def execute(self, **kwargs) -> Dict[str, Any]:
         question = kwargs.get("question", "")
         context = kwargs.get("context", "无")
@@ -99,10 +251,30 @@ class SQLQueryTool(BaseTool):
         if not question:
             return {"success": False, "result": "请提供查询问题"}
 
-        result = self.chain.invoke({"question": question, "context": context})
-        response = result["response"]
-        sql = result["clean_query"]
-        raw = result["sql_result"]
+        key = self._cache_key(question, context)
+        cached = self._cache.get(key)
+        if cached is not None:
+            logger.info("SQL query cache hit")
+            response, sql, raw = cached["response"], cached["sql"], cached["raw_result"]
+        else:
+            schema_version = self.db.schema_version()
+            vec = embed(_SQL_EMBEDDING_MODEL, self._normalise(question))
+            sql = self._semantic_lookup(question, vec, schema_version, context)
+            if sql is not None:
+                # Reuse the SQL of a paraphrased question but re-run it for fresh data.
+                raw = self.db.execute_sql(sql)
+                response = self._synthesise(question, context, sql, raw)
+            else:
+                result = self.chain.invoke({"question": question, "context": context})
+                response = result["response"]
+                sql = result["clean_query"]
+                raw = result["sql_result"]
+                if not self._is_error(raw):
+                    self._semantic_store(question, vec, schema_version, context, sql)
+            # QuerySQLDataBaseTool reports failures as an "Error: ..." string rather than raising;
+            # caching one would replay it even if the LLM writes working SQL next time.
+            if not self._is_error(raw):
+                self._cache.set(key, {"response": response, "sql": sql, "raw_result": raw}, ttl=SQL_CACHE_TTL)
 
         return {
             "success": True,
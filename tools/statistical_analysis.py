@@ -1,14 +1,113 @@
-from typing import Any, Dict, Optional
+import hashlib
+import os
+import re
+from typing import Any, Dict, List, Optional, Pattern, Tuple
 
+import numpy as np
 import pandas as pd
 
+try:  # optional: JIT-compiled skew over all columns at once
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
 from core.database import DatabaseManager
 from core.llm_client import LLMClient
-from tools.base_tool import BaseTool
+from tools.base_tool import BaseTool, df_to_md, extract_sql
+from utils.cache import CACHE_DIR, SQLiteCache
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+_TEMPLATE_CACHE_PATH = os.path.join(CACHE_DIR, "statistical_templates.db")
+TEMPLATE_CACHE_TTL = 7 * 24 * 3600
+_NUM_SLOT = r"\d+(?:\.\d+)?"
+_QUOTED_RE = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"")
+_PERCENTILE_RE = re.compile(r"分位|中位|四分|percentile|quartile|median", re.IGNORECASE)
+MAX_TABLE_ROWS = 50
+# float64 columns whose magnitude stays below this may be reduced as float32.
+_FLOAT32_SAFE_MAX = 1e30
+
+
+def _md(df: pd.DataFrame, n: int = MAX_TABLE_ROWS) -> str:
+    """Markdown table of at most ``n`` rows of ``df``, noting any truncation."""
+    text = df_to_md(df.head(n))
+    if len(df) > n:
+        text += f"\n\n（仅显示前 {n} 行，共 {len(df)} 行）"
+    return text
+
+
+def _downcast(numeric: pd.DataFrame, magnitude: pd.Series) -> pd.DataFrame:
+    """``numeric`` with float64 columns as float32 where ``magnitude`` (max |value|) allows.
+
+    Halves the bytes a reduction has to stream; ``magnitude`` is passed in
+    because callers usually have min/max at hand already.
+    """
+    safe = [c for c in numeric.select_dtypes("float64").columns if magnitude[c] < _FLOAT32_SAFE_MAX]
+    if not safe:
+        return numeric
+    return numeric.astype(dict.fromkeys(safe, "float32"))
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _skew_columns(a):
+        """NaN-skipping sample skewness of every column of ``a``, bias-corrected like pandas."""
+        n, k = a.shape
+        out = np.empty(k)
+        for j in prange(k):
+            count = 0
+            total = 0.0
+            for i in range(n):
+                v = a[i, j]
+                if not np.isnan(v):
+                    count += 1
+                    total += v
+            if count < 3:
+                out[j] = np.nan
+                continue
+            mean = total / count
+            m2 = 0.0
+            m3 = 0.0
+            for i in range(n):
+                v = a[i, j]
+                if not np.isnan(v):
+                    d = v - mean
+                    m2 += d * d
+                    m3 += d * d * d
+            if m2 == 0.0:
+                out[j] = 0.0
+            else:
+                out[j] = count * (count - 1.0) ** 0.5 / (count - 2.0) * (m3 / m2 ** 1.5)
+        return out
+else:
+    _skew_columns = None
+
+
+def _skew(numeric: pd.DataFrame, magnitude: pd.Series) -> pd.Series:
+    """Skewness of every column; a parallel JIT kernel when numba is installed."""
+    if _skew_columns is not None:
+        arr = np.asfortranarray(numeric.to_numpy(dtype=np.float64))
+        return pd.Series(_skew_columns(arr), index=numeric.columns)
+    return _downcast(numeric, magnitude).skew()
+
+
+def _corr(numeric: pd.DataFrame) -> pd.DataFrame:
+    """Pearson correlation matrix; one matmul when there are no missing values.
+
+    With NaNs present pandas' pairwise-complete handling is needed, so that
+    case still goes through ``DataFrame.corr``.
+    """
+    arr = numeric.to_numpy(dtype=np.float64)
+    if np.isnan(arr).any():
+        return numeric.corr()
+    arr = arr - arr.mean(axis=0)
+    cov = arr.T @ arr
+    d = np.sqrt(np.diag(cov))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.outer(d, d)
+    return pd.DataFrame(corr, index=numeric.columns, columns=numeric.columns)
+
 
 class StatisticalAnalysisTool(BaseTool):
     """Perform statistical analysis on database data."""
@@ -27,6 +126,15 @@ class StatisticalAnalysisTool(BaseTool):
     def __init__(self, db: DatabaseManager, llm: LLMClient):
         self.db = db
         self.llm = llm
+        # Question template -> SQL with <NUMi>/<COLi> slots; see _template_key.
+        self._templates = SQLiteCache(_TEMPLATE_CACHE_PATH, table="sql_templates")
+        self._slot_re: Optional[Tuple[int, Pattern]] = None
+        self._schema_cache: Optional[Tuple[int, str]] = None  # (schema_version, table info)
+
+    def invalidate_schema(self):
+        """Forget the cached schema text and slot pattern; call after DDL."""
+        self._schema_cache = None
+        self._slot_re = None
 
     def execute(self, **kwargs) -> Dict[str, Any]:
         question = kwargs.get("question", "")
@@ -40,6 +148,10 @@ class StatisticalAnalysisTool(BaseTool):
             if not sql:
                 return {"success": False, "result": "无法生成分析SQL"}
             df = self._safe_query(sql)
+            if df is None and self._forget_template(question, analysis_type):
+                # SQL materialised from a cached template failed; ask the LLM instead.
+                sql = self._generate_analysis_sql(question, analysis_type)
+                df = self._safe_query(sql) if sql else None
             if df is None:
                 return {"success": False, "result": f"SQL执行失败: {sql}"}
         else:
@@ -63,34 +175,103 @@ class StatisticalAnalysisTool(BaseTool):
 
     # ------------------------------------------------------------------
     def _generate_analysis_sql(self, question: str, analysis_type: str) -> Optional[str]:
-        schema = self.db.get_table_info()
-        prompt = f"""你是SQL专家。为以下统计分析需求生成SQL。
+        key, slots = self._template_key(question, analysis_type)
+        cached = self._templates.get(key)
+        if cached is not None:
+            sql = cached["sql"]
+            for marker, value in slots:
+                sql = sql.replace(marker, value)
+            logger.info("Analysis SQL from cached template: %s", sql)
+            return sql
+
+        schema = self._schema_text()
+        # Static instructions and schema first, so providers can reuse the cached prefix.
+        system = f"""你是SQL专家。为用户的统计分析需求生成SQL，只返回SQL，不要其他说明。
 
 表结构:
-{schema}
+{schema}"""
+        response = self.llm.chat([
+            {"role": "system", "content": system},
+            {"role": "user", "content": f"分析需求: {question}\n分析类型: {analysis_type}"},
+        ])
+        sql = extract_sql(response)
+        if sql:
+            template = self._parameterise(sql, slots)
+            if template is not None:
+                self._templates.set(key, {"sql": template}, ttl=TEMPLATE_CACHE_TTL)
+        return sql
 
-分析需求: {question}
-分析类型: {analysis_type}
+    def _schema_text(self) -> str:
+        """Table info for the prompt, rebuilt only when the schema version moves."""
+        version = self.db.schema_version()
+        if self._schema_cache is None or self._schema_cache[0] != version:
+            if self._schema_cache is not None:
+                self.db.invalidate_schema_cache()
+            self._schema_cache = (version, self.db.get_table_info())
+        return self._schema_cache[1]
 
-只返回SQL，不要其他说明。"""
-        response = self.llm.chat([{"role": "user", "content": prompt}])
-        return self._extract_sql(response)
+    # ------------------------------------------------------------------
+    # Question templates: numbers and column names in the question are
+    # slots, so "2023年sales趋势" and "2024年item_qty趋势" share one SQL
+    # template and only the first needs the LLM.
+    # ------------------------------------------------------------------
+    def _slot_pattern(self) -> Pattern:
+        version = self.db.schema_version()
+        if self._slot_re is None or self._slot_re[0] != version:
+            names = {c["name"] for cols in self.db.get_all_columns().values() for c in cols}
+            alts = "|".join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+            col = rf"(?P<col>(?<![A-Za-z0-9_])(?:{alts})(?![A-Za-z0-9_]))|" if alts else ""
+            self._slot_re = (version, re.compile(rf"{col}(?P<num>{_NUM_SLOT})"))
+        return self._slot_re[1]
+
+    def _template_key(self, question: str, analysis_type: str) -> Tuple[str, List[Tuple[str, str]]]:
+        """Cache key of the question's template, plus its slot markers and values in order."""
+        parts, slots, pos = [], [], 0
+        for m in self._slot_pattern().finditer(question):
+            kind = "COL" if m.lastgroup == "col" else "NUM"
+            slots.append((f"<{kind}{len(slots)}>", m.group()))
+            parts.extend((question[pos:m.start()], f"<{kind}>"))
+            pos = m.end()
+        parts.append(question[pos:])
+        template = " ".join("".join(parts).split())
+        raw = f"{analysis_type}|{self.db.schema_version()}|{template}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest(), slots
 
     @staticmethod
-    def _extract_sql(text: str) -> Optional[str]:
-        text = text.strip()
-        if "```sql" in text:
-            text = text.split("```sql", 1)[1].split("```")[0].strip()
-        elif "```" in text:
-            text = text.split("```", 1)[1].split("```")[0].strip()
-        if "SELECT" in text.upper():
-            idx = text.upper().find("SELECT")
-            return text[idx:].rstrip(";").strip()
-        return None
+    def _parameterise(sql: str, slots: List[Tuple[str, str]]) -> Optional[str]:
+        """Replace slot values in ``sql`` with their markers, or ``None`` if that is ambiguous.
+
+        Every slot value must appear in the SQL (numbers exactly once) and no
+        two slots may share a value; otherwise a different question could not
+        be materialised from the template safely. Numbers inside quoted
+        literals are refused too: they are usually formatted (``'09'`` for
+        "9月"), so the raw value of another question would still run but
+        match nothing.
+        """
+        values = [v for _, v in slots]
+        if len(set(values)) != len(values):
+            return None
+        for marker, value in slots:
+            pattern = re.compile(rf"(?<![A-Za-z0-9_.]){re.escape(value)}(?![A-Za-z0-9_.])")
+            hits = list(pattern.finditer(sql))
+            if not hits:
+                return None
+            if marker.startswith("<NUM"):
+                if len(hits) != 1:
+                    return None
+                pos = hits[0].start()
+                if any(q.start() < pos < q.end() for q in _QUOTED_RE.finditer(sql)):
+                    return None
+            sql = pattern.sub(marker, sql)
+        return sql
+
+    def _forget_template(self, question: str, analysis_type: str) -> bool:
+        key, _ = self._template_key(question, analysis_type)
+        return self._templates.delete(key)
 
     def _safe_query(self, sql: str) -> Optional[pd.DataFrame]:
         try:
-            return self.db.execute_sql_df(sql)
+            return self.db.execute_sql_df(sql, columnar=True)
         except Exception as e:
             logger.error("Statistical SQL failed: %s | %s", sql, e)
             return None
@@ -103,21 +284,27 @@ class StatisticalAnalysisTool(BaseTool):
         if numeric.empty:
             return {
                 "success": True,
-                "result": f"查询结果（{len(df)}行 x {len(df.columns)}列）：\n{df.head(20).to_markdown(index=False)}",
+                "result": f"查询结果（{len(df)}行 x {len(df.columns)}列）：\n{df_to_md(df.head(20))}",
                 "dataframe": df,
             }
 
-        stats = numeric.describe().round(2)
-        text = f"## 描述性统计\n\n{stats.to_markdown()}\n\n"
+        stats = numeric.agg(["count", "mean", "std", "min", "max"])
+        skews = _skew(numeric, stats.loc[["min", "max"]].abs().max())
+        # Percentiles need a sort per column, so only pay for them when asked.
+        if _PERCENTILE_RE.search(question):
+            quantiles = numeric.quantile([0.25, 0.5, 0.75])
+            quantiles.index = ["25%", "50%", "75%"]
+            stats = pd.concat([stats, quantiles])
+        stats = stats.round(2)
+        text = f"## 描述性统计\n\n{df_to_md(stats, index=True)}\n\n"
         text += f"数据共 {len(df)} 行, {len(df.columns)} 列。\n"
-        for col in numeric.columns:
-            skew = numeric[col].skew()
+        for col, skew in skews.items():
             text += f"- **{col}** 偏度={skew:.2f} ({'右偏' if skew > 0.5 else '左偏' if skew < -0.5 else '近似正态'})\n"
 
         return {
             "success": True,
             "result": text,
-            "data": {"stats": stats.to_dict()},
+            "data": {"stats": stats.to_dict(orient="split")},
             "dataframe": df,
         }
 
@@ -126,14 +313,13 @@ class StatisticalAnalysisTool(BaseTool):
         if numeric.shape[1] < 2:
             return {"success": False, "result": "数值列不足2列，无法进行相关性分析"}
 
-        corr = numeric.corr().round(3)
-        text = f"## 相关性分析\n\n{corr.to_markdown()}\n\n"
-        strong = []
-        for i in range(len(corr.columns)):
-            for j in range(i + 1, len(corr.columns)):
-                val = corr.iloc[i, j]
-                if abs(val) > 0.7:
-                    strong.append((corr.columns[i], corr.columns[j], val))
+        corr = _corr(numeric).round(3)
+        text = f"## 相关性分析\n\n{df_to_md(corr, index=True)}\n\n"
+        vals = corr.to_numpy()
+        rows, cols = np.triu_indices_from(vals, k=1)
+        upper = vals[rows, cols]
+        mask = np.abs(upper) > 0.7
+        strong = list(zip(corr.columns[rows[mask]], corr.columns[cols[mask]], upper[mask]))
         if strong:
             text += "### 强相关字段对\n"
             for a, b, v in strong:
@@ -142,42 +328,50 @@ class StatisticalAnalysisTool(BaseTool):
         return {
             "success": True,
             "result": text,
-            "data": {"correlation": corr.to_dict()},
+            "data": {"correlation": corr.to_dict(orient="split")},
             "dataframe": df,
         }
 
     def _trend(self, df: pd.DataFrame, question: str) -> Dict[str, Any]:
         date_cols = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
         if not date_cols:
-            for col in df.columns:
+            # Only text columns can hold unparsed dates; probe a sample before
+            # converting the whole column.
+            for col in df.select_dtypes(include=["object", "string"]).columns:
+                sample = df[col].dropna().head(100)
+                if sample.empty:
+                    continue
                 try:
-                    df[col] = pd.to_datetime(df[col], errors="coerce")
-                    if df[col].notna().sum() > len(df) * 0.5:
-                        date_cols.append(col)
-                        break
-                except Exception:
-                    pass
+                    parsed = pd.to_datetime(sample, errors="coerce", format="mixed")
+                except (ValueError, TypeError):
+                    continue
+                if parsed.notna().mean() > 0.5:
+                    df[col] = pd.to_datetime(df[col], errors="coerce", format="mixed")
+                    date_cols.append(col)
+                    break
 
         text = f"## 趋势分析\n\n数据包含 {len(df)} 个时间点。\n"
         numeric = df.select_dtypes(include="number")
-        for col in numeric.columns:
-            vals = numeric[col].dropna()
-            if len(vals) < 2:
-                continue
-            pct_change = ((vals.iloc[-1] - vals.iloc[0]) / vals.iloc[0] * 100) if vals.iloc[0] != 0 else 0
-            text += f"- **{col}**: 起始={vals.iloc[0]:,.2f}, 结束={vals.iloc[-1]:,.2f}, 变化率={pct_change:+.1f}%\n"
+        numeric = numeric.loc[:, numeric.count() >= 2]
+        # First and last non-null value of every column at once.
+        first, last = numeric.bfill().iloc[0], numeric.ffill().iloc[-1]
+        pct = ((last - first) / first.where(first != 0) * 100).fillna(0)
+        for col, start, end, pct_change in zip(numeric.columns, first, last, pct):
+            text += f"- **{col}**: 起始={start:,.2f}, 结束={end:,.2f}, 变化率={pct_change:+.1f}%\n"
 
-        text += f"\n### 数据预览\n{df.head(10).to_markdown(index=False)}\n"
+        text += f"\n### 数据预览\n{_md(df, 10)}\n"
         return {"success": True, "result": text, "dataframe": df}
 
     def _top_n(self, df: pd.DataFrame, question: str) -> Dict[str, Any]:
-        text = f"## Top-N 分析\n\n{df.to_markdown(index=False)}\n"
+        text = f"## Top-N 分析\n\n{_md(df)}\n"
         return {"success": True, "result": text, "dataframe": df}
 
     def _comparison(self, df: pd.DataFrame, question: str) -> Dict[str, Any]:
-        text = f"## 对比分析\n\n{df.to_markdown(index=False)}\n\n"
-        numeric = df.select_dtypes(include="number")
+        text = f"## 对比分析\n\n{_md(df)}\n\n"
+        numeric = df.select_dtypes(include="number").dropna(axis=1, how="all")
         if not numeric.empty:
-            for col in numeric.columns:
-                text += f"- **{col}** 最大值行: {df.iloc[numeric[col].idxmax()].to_dict()}\n"
+            # Row label of every column's maximum in one reduction, then one lookup.
+            rows = df.loc[numeric.idxmax().to_numpy()].to_dict(orient="records")
+            for col, row in zip(numeric.columns, rows):
+                text += f"- **{col}** 最大值行: {row}\n"
         return {"success": True, "result": text, "dataframe": df}
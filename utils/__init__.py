@@ -1,3 +1,4 @@
+from utils.cache import SQLiteCache, TTLCache
 from utils.logger import get_logger, setup_logging
 
-__all__ = ["get_logger", "setup_logging"]
+__all__ = ["SQLiteCache", "TTLCache", "get_logger", "setup_logging"]
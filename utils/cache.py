@@ -0,0 +1,128 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Persistent caches live under the project root, like logs/, whatever the cwd.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache")
+
+
+class TTLCache:
+    """Thread-safe in-memory cache whose entries expire after ``ttl`` seconds.
+
+    Loads are single-flight: when several threads miss on the same key only
+    one of them runs the loader while the others wait for its result. Each
+    entry's lifetime is jittered by ``±jitter`` so entries filled together do
+    not all expire at the same moment.
+    """
+
+    def __init__(self, ttl: float = 60.0, jitter: float = 0.05):
+        self.ttl = ttl
+        self.jitter = jitter
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}  # key -> (expires_at, value)
+        self._inflight: Dict[Hashable, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        while True:
+            with self._lock:
+                entry = self._data.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+                event = self._inflight.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._inflight[key] = event
+                    break
+            # Another thread is loading this key; if it fails we retry ourselves.
+            event.wait()
+
+        try:
+            value = loader()
+            lifetime = self.ttl * random.uniform(1 - self.jitter, 1 + self.jitter)
+            with self._lock:
+                self._data[key] = (time.monotonic() + lifetime, value)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    def invalidate(self, match: Optional[Callable[[Hashable], bool]] = None):
+        """Drop every entry, or only those whose key satisfies ``match``."""
+        with self._lock:
+            if match is None:
+                self._data.clear()
+            else:
+                for key in [k for k in self._data if match(k)]:
+                    del self._data[key]
+
+
+class SQLiteCache:
+    """Persistent string-keyed cache stored in a SQLite file.
+
+    Values are stored as JSON, so they must be JSON-serialisable. Each entry
+    has its own expiry time, and expired entries read as misses. Storage
+    errors are logged and treated as misses so a broken cache never fails
+    the caller.
+    """
+
+    def __init__(self, path: str, table: str = "cache"):
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Cache read failed (%s): %s", self.path, e)
+            return None
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        try:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at),
+            )
+        except sqlite3.Error as e:
+            logger.warning("Cache write failed (%s): %s", self.path, e)
+
+    def delete(self, key: str) -> bool:
+        """Remove ``key``; returns whether it was present."""
+        try:
+            return self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount > 0
+        except sqlite3.Error as e:
+            logger.warning("Cache delete failed (%s): %s", self.path, e)
+            return False
+
+    def clear(self):
+        try:
+            self._conn.execute(f"DELETE FROM {self.table}")
+        except sqlite3.Error as e:
+            logger.warning("Cache clear failed (%s): %s", self.path, e)
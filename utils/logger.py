@@ -1,14 +1,21 @@
+import atexit
+import functools
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 
-_LOG_DIR = "logs"
+_LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
 _initialized = False
 
 
 def setup_logging(level: int = logging.INFO):
-    """Configure root logging for the application."""
+    """Configure root logging for the application.
+
+    Records are handed to a queue and written by a background listener
+    thread, so console and file I/O stay off the calling thread.
+    """
     global _initialized
     if _initialized:
         return
@@ -20,7 +27,6 @@ def setup_logging(level: int = logging.INFO):
     console = logging.StreamHandler()
     console.setLevel(level)
     console.setFormatter(logging.Formatter("%(asctime)s [%(name)s] %(levelname)s - %(message)s"))
-    root.addHandler(console)
 
     file_handler = RotatingFileHandler(
         os.path.join(_LOG_DIR, "app.log"),
@@ -31,10 +37,17 @@ def setup_logging(level: int = logging.INFO):
     file_handler.setFormatter(
         logging.Formatter("%(asctime)s [%(name)s] %(levelname)s - %(message)s")
     )
-    root.addHandler(file_handler)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, console, file_handler, respect_handler_level=True)
+    listener.start()
+    # Drain whatever is still queued before the interpreter exits.
+    atexit.register(listener.stop)
     _initialized = True
 
 
+@functools.lru_cache(maxsize=None)
 def get_logger(name: str) -> logging.Logger:
     """Return a named logger; ensures logging is set up."""
     setup_logging()